@@ -0,0 +1,70 @@
+"""asv benchmarks of the end-to-end scenarios, on a local synthetic archive.
+
+Run them from the root of the repository (see asv.conf.json) with e.g.
+`asv run` or `asv continuous main HEAD`. The same scenarios can be run
+without asv (and over memory:// or HTTP) with run.py.
+"""
+
+import os
+import time
+
+try:
+    from .scenarios import SCENARIOS
+except ImportError:
+    from scenarios import SCENARIOS
+
+GRID_REDUCTION = 4
+
+
+class EndToEnd:
+    params = list(SCENARIOS)
+    param_names = ["scenario"]
+    timeout = 600
+
+    def setup_cache(self):
+        root = os.path.abspath("synthetic_archive")
+        for scenario in SCENARIOS.values():
+            scenario().write(GRID_REDUCTION, url_prefix=root)
+        return root
+
+    def _run(self, root, name, **options):
+        scenario = SCENARIOS[name]()
+        datasets = scenario.open(
+            GRID_REDUCTION, data_protocol="file", url_prefix=root, **options
+        )
+        scenario.run(datasets)
+
+    def _recorded(self, root, name):
+        from intake_informaticslab.zarrhypothetic.instrumentation import ChunkRecorder
+
+        recorder = ChunkRecorder(keep_events=True)
+        start = time.perf_counter()
+        self._run(root, name, hooks=[recorder])
+        wall = time.perf_counter() - start
+        return [event for event in recorder.events if event.url is not None], wall
+
+    def time_run(self, root, name):
+        self._run(root, name)
+
+    def peakmem_run(self, root, name):
+        self._run(root, name)
+
+    def track_requests(self, root, name):
+        events, _ = self._recorded(root, name)
+        return len(events)
+
+    track_requests.unit = "requests"
+
+    def track_megabytes_per_second(self, root, name):
+        events, wall = self._recorded(root, name)
+        return sum(event.nbytes or 0 for event in events) / 2**20 / wall
+
+    track_megabytes_per_second.unit = "MB/s"
+
+
+def timeraw_import():
+    return "import intake_informaticslab"
+
+
+def timeraw_import_catalog():
+    return "import intake_informaticslab; intake_informaticslab.cat"
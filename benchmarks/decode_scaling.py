@@ -0,0 +1,119 @@
+"""Benchmark decoding on threads against a pool of decode processes.
+
+Writes a small archive of zlib compressed MOGREPS-UK shaped files to a
+temporary directory, then reads all of it through MODataset with every
+number of decode processes up to the number of cores, e.g.
+
+    python benchmarks/decode_scaling.py --cycles 8 --leads 8
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from intake_informaticslab.datasources.dataset import MODataset
+
+DIAG = "temperature_at_screen_level"
+
+
+def make_dataset(root, cycles, leads, size, **kwargs):
+    return MODataset(
+        start_cycle="20200101T0000Z",
+        end_cycle=(
+            pd.Timestamp("2020-01-01") + pd.Timedelta(hours=cycles - 1)
+        ).strftime("%Y%m%dT%H%MZ"),
+        model="mo-atmospheric-mogreps-uk",
+        dims=[
+            "forecast_reference_time",
+            "forecast_period",
+            "realization",
+            "projection_y_coordinate",
+            "projection_x_coordinate",
+        ],
+        diagnostics=[DIAG],
+        static_coords={
+            "realization": {"data": list(range(3))},
+            "projection_y_coordinate": {
+                "data": {"start": 0, "stop": size, "num": size}
+            },
+            "projection_x_coordinate": {
+                "data": {"start": 0, "stop": size, "num": size}
+            },
+        },
+        cycle_freq="1H",
+        start_lead_time="0H",
+        end_lead_time=f"{leads - 1}H",
+        lead_time_freq="1H",
+        data_protocol="file",
+        url_prefix=root,
+        **kwargs,
+    )
+
+
+def write_archive(dataset):
+    coords = {
+        name: var.values
+        for name, var in dataset.static_coords.items()
+        if name in dataset.dims
+    }
+    shape = tuple(len(values) for values in coords.values())
+    rng = np.random.default_rng(0)
+    nbytes = 0
+    for cycle in dataset.dynamic_coords["forecast_reference_time"].values:
+        for lead in dataset.dynamic_coords["forecast_period"].values:
+            # smooth fields with noise compress (and decompress) like real ones
+            data = np.cumsum(rng.normal(size=shape), axis=-1).astype("float32")
+            ds = xr.Dataset({"air_temperature": (tuple(coords), data)}, coords=coords)
+            url = dataset._get_url(
+                DIAG, cycle_time=pd.Timestamp(cycle), lead_time=pd.Timedelta(lead)
+            )
+            path = dataset._url_to_path(url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ds.to_netcdf(
+                path, engine="h5netcdf", encoding={"air_temperature": {"zlib": True}}
+            )
+            nbytes += data.nbytes
+    return nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cycles", type=int, default=4)
+    parser.add_argument("--leads", type=int, default=8)
+    parser.add_argument("--size", type=int, default=500, help="grid points per side")
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        nbytes = write_archive(make_dataset(root, args.cycles, args.leads, args.size))
+        print(f"{nbytes / 2**20:.0f} MB decoded per run, {os.cpu_count()} cores")
+        print(f"{'processes':>10} {'seconds':>8} {'MB/s':>8}")
+        for processes in [None] + list(range(1, args.max_processes + 1)):
+            dataset = make_dataset(
+                root,
+                args.cycles,
+                args.leads,
+                args.size,
+                decode_processes=processes,
+                max_concurrent_loads=os.cpu_count(),
+            )
+            # the first file makes the decode plan, then start the workers
+            dataset.ds[DIAG][0, 0].values
+            if dataset._decode_pool is not None:
+                list(dataset._decode_pool.executor.map(abs, range(4 * processes)))
+            start = time.perf_counter()
+            dataset.ds[DIAG].data.compute(scheduler="threads")
+            elapsed = time.perf_counter() - start
+            if dataset._decode_pool is not None:
+                dataset._decode_pool.shutdown()
+            label = processes or "threads"
+            print(f"{label:>10} {elapsed:8.2f} {nbytes / 2**20 / elapsed:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Benchmark the time taken by `import intake_informaticslab`.
+
+Each import is timed in a fresh interpreter, and the median is compared
+with the time taken by the interpreter alone, e.g.
+
+    python benchmarks/import_time.py --repeat 20 --max 0.1
+
+exits with an error if importing the package takes more than --max seconds.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_python(code, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max", type=float, help="fail above this many seconds")
+    args = parser.parse_args()
+
+    baseline = time_python("pass", args.repeat)
+    results = {
+        "import": time_python("import intake_informaticslab", args.repeat),
+        "import + cat": time_python(
+            "import intake_informaticslab; intake_informaticslab.cat", args.repeat
+        ),
+    }
+    print(f"{'':<14} {'seconds':>8}")
+    for name, seconds in results.items():
+        print(f"{name:<14} {seconds - baseline:8.3f}")
+    if args.max is not None and results["import"] - baseline > args.max:
+        sys.exit(f"import took longer than {args.max}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Run the end-to-end benchmark scenarios against synthetic archives.
+
+Each scenario runs in a fresh process (so that no cache, negative cache or
+limiter is warm) and reports its wall time, the data downloaded and the
+rate of it, the peak resident memory and the number of requests, e.g.
+
+    python benchmarks/run.py --grid-reduction 4
+    python benchmarks/run.py --protocol http --latency 0.05 --error-rate 0.01
+    python benchmarks/run.py read_one_field --option read_mode='"lazy"'
+
+Archives are written to a temporary directory unless --root is given, in
+which case they are kept there (they are written again on every run). The
+package is imported from this checkout, so it needn't be installed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+# run from a checkout: import the package next to benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scenarios import SCENARIOS  # noqa: E402
+
+
+def _rss():
+    """Current resident memory in bytes (on Linux), else the peak so far."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is in kB on Linux but bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class PeakMemory:
+    """Sample the resident memory on a thread, keeping the peak."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = _rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss())
+
+
+def measure(name, grid_reduction, storage, options, write):
+    """Run scenario name once in this process and return its measurements."""
+    from intake_informaticslab.zarrhypothetic.instrumentation import ChunkRecorder
+
+    scenario = SCENARIOS[name]()
+    if write:
+        # e.g. memory:// archives, which only exist in this process
+        scenario.write(grid_reduction, **storage)
+    recorder = ChunkRecorder(keep_events=True)
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        datasets = scenario.open(grid_reduction, hooks=[recorder], **storage, **options)
+        scenario.run(datasets)
+        wall = time.perf_counter() - start
+    events = [event for event in recorder.events if event.url is not None]
+    sizes = [event.nbytes for event in events]
+    return {
+        "wall": wall,
+        # not known for lazy reads, which fetch parts of files
+        "bytes": None if None in sizes else sum(sizes),
+        "requests": len(events),
+        "peak_rss": memory.peak,
+    }
+
+
+def _measure_in_process(args):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(measure, args)
+
+
+def _parse_options(options):
+    parsed = {}
+    for option in options:
+        key, _, value = option.partition("=")
+        parsed[key] = json.loads(value)
+    return parsed
+
+
+def run(args, root):
+    from intake_informaticslab.synthetic import SyntheticServer
+
+    options = _parse_options(args.option)
+    server = None
+    if args.protocol == "http":
+        error_rates = {503: args.error_rate} if args.error_rate else None
+        server = SyntheticServer(
+            root,
+            latency=args.latency,
+            bandwidth=args.bandwidth,
+            error_rates=error_rates,
+        ).start()
+
+    print(
+        f"{'scenario':<18} {'seconds':>8} {'MB':>8} {'MB/s':>8} "
+        f"{'peak MB':>8} {'requests':>9}"
+    )
+    try:
+        for name in args.scenarios:
+            scenario = SCENARIOS[name]()
+            write = args.protocol == "memory"
+            if args.protocol == "memory":
+                storage = {
+                    "data_protocol": "memory",
+                    "url_prefix": f"benchmarks/{name}",
+                }
+            else:
+                # written once as files, served as they are or over HTTP
+                scenario.write(args.grid_reduction, url_prefix=root)
+                storage = {"data_protocol": "file", "url_prefix": root}
+                if server is not None:
+                    server.stats.update(requests=0, errors=0, bytes=0)
+                    storage = {"data_protocol": "http", "url_prefix": server.url_prefix}
+            result = _measure_in_process(
+                (name, args.grid_reduction, storage, options, write)
+            )
+            if server is not None:
+                # what was actually sent, including retries and ranged reads
+                result["bytes"] = server.stats["bytes"]
+                result["requests"] = server.stats["requests"]
+            if result["bytes"] is None:
+                mb = rate = "-"
+            else:
+                mb = f"{result['bytes'] / 2**20:.1f}"
+                rate = f"{result['bytes'] / 2**20 / result['wall']:.1f}"
+            print(
+                f"{name:<18} {result['wall']:8.2f} {mb:>8} {rate:>8} "
+                f"{result['peak_rss'] / 2**20:8.0f} {result['requests']:>9}"
+            )
+    finally:
+        if server is not None:
+            server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default all)"
+    )
+    parser.add_argument(
+        "--grid-reduction",
+        type=int,
+        default=4,
+        help="divide the points along each grid dim by this",
+    )
+    parser.add_argument(
+        "--protocol", choices=["file", "memory", "http"], default="file"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds (http)")
+    parser.add_argument("--bandwidth", type=float, help="bytes per second (http)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503s (http)")
+    parser.add_argument("--root", help="directory to keep the archives in")
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        help="dataset option as key=json, e.g. prefetch=2",
+    )
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+
+    if args.root is not None:
+        os.makedirs(args.root, exist_ok=True)
+        run(args, os.path.abspath(args.root))
+    else:
+        with tempfile.TemporaryDirectory() as root:
+            run(args, root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""End-to-end scenarios run by the benchmarks, against synthetic archives.
+
+Each scenario names the catalog entries (and the part of them) it reads,
+so that the archive it needs can be written once, and runs a typical
+workload given a function that opens the dataset of an entry.
+"""
+
+from intake_informaticslab.synthetic import make_dataset, write_archive
+
+
+class Scenario:
+    name = None
+    # catalog entries read and the part of them written to the archive
+    entries = ()
+    start = "20200101T0000Z"
+    end = "20200101T0000Z"
+    forecast_extent = None
+    diagnostics = None
+    # scenarios that only open datasets don't need any files
+    needs_files = True
+
+    def open(self, grid_reduction=1, **kwargs):
+        """Return the datasets of the scenario's entries."""
+        return [
+            make_dataset(
+                entry,
+                self.start,
+                self.end,
+                grid_reduction=grid_reduction,
+                forecast_extent=self.forecast_extent,
+                diagnostics=self.diagnostics,
+                **kwargs,
+            )
+            for entry in self.entries
+        ]
+
+    def write(self, grid_reduction=1, **kwargs):
+        """Write the archive of the scenario, returning its size in bytes.
+
+        kwargs give the storage to write to (data_protocol and url_prefix).
+        """
+        nbytes = 0
+        if self.needs_files:
+            for dataset in self.open(grid_reduction, **kwargs):
+                nbytes += write_archive(dataset)["bytes"]
+        return nbytes
+
+    def run(self, datasets):
+        raise NotImplementedError
+
+
+class OpenMogrepsUK(Scenario):
+    """Open every MOGREPS-UK dataset over a year of hourly cycles."""
+
+    name = "open_mogreps_uk"
+    entries = (
+        "mogreps_uk/single_level",
+        "mogreps_uk/height_level",
+        "mogreps_uk/pressure_level",
+        "mogreps_uk/depth_level",
+    )
+    end = "20201230T2300Z"
+    needs_files = False
+
+    def run(self, datasets):
+        for dataset in datasets:
+            dataset.ds
+
+
+class ReadOneField(Scenario):
+    """Read one diagnostic of one lead time of one cycle of MOGREPS-UK."""
+
+    name = "read_one_field"
+    entries = ("mogreps_uk/single_level",)
+    forecast_extent = "0H"
+    diagnostics = ["temperature_at_screen_level"]
+
+    def run(self, datasets):
+        (dataset,) = datasets
+        dataset.ds["temperature_at_screen_level"][0, 0].values
+
+
+class ScanAQMonth(Scenario):
+    """Mean over the grid of 30 days of hourly air quality."""
+
+    name = "scan_aq_30_days"
+    entries = ("air_quality_hourly",)
+    end = "20200130T2300Z"
+    diagnostics = ["o3"]
+
+    def run(self, datasets):
+        (dataset,) = datasets
+        dataset.ds["o3"].mean(
+            ["projection_y_coordinate", "projection_x_coordinate"]
+        ).values
+
+
+class UKVPointYear(Scenario):
+    """Read one grid point from a year of daily UKV time series."""
+
+    name = "ukv_point_year"
+    entries = ("ukv_daily_timeseries",)
+    end = "20201230T0000Z"
+    diagnostics = ["t1o5m_mean"]
+
+    def run(self, datasets):
+        (dataset,) = datasets
+        data = dataset.ds["t1o5m_mean"]
+        data.isel(grid_latitude=len(data.grid_latitude) // 2, grid_longitude=0).values
+
+
+class EnsembleMean(Scenario):
+    """Ensemble mean of a diagnostic over a whole MOGREPS-UK forecast."""
+
+    name = "ensemble_mean"
+    entries = ("mogreps_uk/single_level",)
+    forecast_extent = "126H"
+    diagnostics = ["temperature_at_screen_level"]
+
+    def run(self, datasets):
+        (dataset,) = datasets
+        dataset.ds["temperature_at_screen_level"][0].mean("realization").values
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        OpenMogrepsUK,
+        ReadOneField,
+        ScanAQMonth,
+        UKVPointYear,
+        EnsembleMean,
+    )
+}
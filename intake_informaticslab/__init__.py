@@ -8,25 +8,49 @@ del get_versions
 
 
 import os
-
-import intake
-
-from .datasources import (LicenseNotExceptedError, MergedMetOfficeDataSource,
-                          MetOfficeDataSource)
+import threading
 
 CATALOG_DIR = os.path.join(os.path.dirname(__file__), 'cats')
 
-mogreps_cat = intake.open_catalog(os.path.join(CATALOG_DIR, 'mogreps_cat.yaml'))
-aq_cat = intake.open_catalog(os.path.join(CATALOG_DIR, 'air_quality_cat.yaml'))
-ukv_single_timeseries = intake.open_catalog(os.path.join(CATALOG_DIR, 'ukv_timeseries_cat.yaml'))
-
-cat = intake.catalog.Catalog.from_dict(
-    {
-        'air_quality': aq_cat,
-        'weather_forecasts': mogreps_cat,
-        'weather_continuous_timeseries': ukv_single_timeseries
-
-    }, name="Met Office Datasets")
+# the catalogs (and the datasources, which import xarray, zarr and so on)
+# are only loaded when first used, so that importing the package is cheap
+_CATALOG_FILES = {
+    'mogreps_cat': 'mogreps_cat.yaml',
+    'aq_cat': 'air_quality_cat.yaml',
+    'ukv_single_timeseries': 'ukv_timeseries_cat.yaml',
+}
+_DATASOURCES = ('LicenseNotExceptedError', 'MergedMetOfficeDataSource', 'MetOfficeDataSource')
+_LOAD_LOCK = threading.RLock()
+
+
+def _load(name):
+    if name in _CATALOG_FILES:
+        import intake
+        return intake.open_catalog(os.path.join(CATALOG_DIR, _CATALOG_FILES[name]))
+    if name == 'cat':
+        import intake
+        return intake.catalog.Catalog.from_dict(
+            {
+                'air_quality': __getattr__('aq_cat'),
+                'weather_forecasts': __getattr__('mogreps_cat'),
+                'weather_continuous_timeseries': __getattr__('ukv_single_timeseries')
+
+            }, name="Met Office Datasets")
+    from . import datasources
+    return getattr(datasources, name)
+
+
+def __getattr__(name):
+    if name not in _CATALOG_FILES and name not in _DATASOURCES and name != 'cat':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _LOAD_LOCK:
+        if name not in globals():
+            globals()[name] = _load(name)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_CATALOG_FILES) | set(_DATASOURCES) | {'cat'})
 
 # fmt: on
 # autopep8: on
@@ -1,15 +1,35 @@
-import datetime
-
 from intake.catalog.local import YAMLFilesCatalog
 from intake.source.base import Schema
 from intake_xarray.base import DataSourceMixin
 
 from intake_informaticslab import __version__
 
-from .dataset import MODataset
-from .utils import datetime_to_iso_str
-
-DATA_DELAY = 24 + 6  # num hours from current time that data is available
+from ..zarrhypothetic.tracing import chrome_trace
+from .dataset import DATA_DELAY, MODataset
+
+# keyword arguments that are passed through to the dataset classes
+DATASET_OPTIONS = (
+    "read_mode",
+    "chunks",
+    "reference_index",
+    "memory_cache_bytes",
+    "cache_dir",
+    "cache_max_bytes",
+    "cache_policy",
+    "compressor",
+    "filters",
+    "max_concurrent_loads",
+    "prefetch",
+    "prefetch_max_bytes",
+    "missing_ttl",
+    "inventory",
+    "latest_ttl",
+    "decode_processes",
+    "adaptive_concurrency",
+    "retries",
+    "hedge",
+    "hooks",
+)
 
 
 class LicenseNotExceptedError(RuntimeError):
@@ -41,12 +61,11 @@ class MetOfficeDataSource(DataSourceMixin):
 
         self.license = license
         self.license_accepted = kwargs.get("license_accepted", False)
+        self.dataset_options = {
+            key: kwargs[key] for key in DATASET_OPTIONS if key in kwargs
+        }
 
-        if end_cycle.lower() == "latest":
-            end_cycle = datetime.datetime.utcnow() - datetime.timedelta(
-                hours=DATA_DELAY
-            )
-            end_cycle = datetime_to_iso_str(end_cycle)
+        # 'latest' is resolved by the dataset when its data is first used
 
         self.start_cycle = start_cycle
         self.end_cycle = end_cycle
@@ -57,6 +76,7 @@ class MetOfficeDataSource(DataSourceMixin):
         self.diagnostics = diagnostics
         self.static_coords = static_coords
         self.storage_options = storage_options
+        self._dataset = None
         self._ds = None
 
     def _open_dataset(self):
@@ -65,7 +85,7 @@ class MetOfficeDataSource(DataSourceMixin):
             if not (str(license_accepted).upper() == "TRUE"):
                 raise LicenseNotExceptedError(self.license)
 
-        self._ds = MODataset(
+        self._dataset = MODataset(
             start_cycle=self.start_cycle,
             end_cycle=self.end_cycle,
             model=self.model,
@@ -76,8 +96,25 @@ class MetOfficeDataSource(DataSourceMixin):
             start_lead_time="0H",
             end_lead_time=self.forecast_extent,
             lead_time_freq="1H",
+            **self.dataset_options,
             **self.storage_options,
-        ).ds
+        )
+        self._ds = self._dataset.ds
+
+    def cache_info(self):
+        """Return hit/miss statistics of the chunk caches, or None if not open."""
+        if self._dataset is None:
+            return None
+        return self._dataset.cache_info()
+
+    def trace(self, path):
+        """Return a context manager writing a Chrome trace of chunk loads to path.
+
+        e.g. ``with source.trace("load.json"): source.to_dask().mean().compute()``
+        """
+        if self._ds is None:
+            self._open_dataset()
+        return self._dataset.trace(path)
 
     def _get_schema(self):
         # adapted from intake-xarray driver
@@ -110,14 +147,17 @@ class MergedMetOfficeDataSource(YAMLFilesCatalog):
         super().__init__(path, flatten=flatten, metadata=metadata)
 
         self._kwargs = kwargs
+        self._sources = {}
         self._ds = None
 
     def to_dask(self):
         if self._ds is not None:
             return self._ds
 
-        for entry in self._entries.values():
-            dataset = entry(**self._kwargs).to_dask()
+        for name, entry in self._entries.items():
+            source = entry(**self._kwargs)
+            self._sources[name] = source
+            dataset = source.to_dask()
             if self._ds is None:
                 self._ds = dataset
             else:
@@ -126,3 +166,13 @@ class MergedMetOfficeDataSource(YAMLFilesCatalog):
 
     def read_chunked(self):
         return self.to_dask()
+
+    def cache_info(self):
+        """Return the chunk cache statistics of each merged source."""
+        return {name: source.cache_info() for name, source in self._sources.items()}
+
+    def trace(self, path):
+        """Return a context manager writing a Chrome trace of chunk loads to path."""
+        self.to_dask()
+        hooks = [source._dataset.hooks for source in self._sources.values()]
+        return chrome_trace(path, *hooks)
@@ -1,6 +1,3 @@
-import datetime
-from io import BytesIO
-
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -28,12 +25,8 @@ class TimeSeriesDatasource(MetOfficeDataSource):
         storage_options,
         license=None,
         metadata=None,
+        **kwargs,
     ):
-
-        if end_datetime.lower() == "latest":
-            end_datetime = datetime_to_iso_str(
-                (datetime.datetime.now() - datetime.timedelta(hours=48))
-            )
         self.timestep = timestep
         self.start_datetime = start_datetime
         self.end_datetime = end_datetime
@@ -50,10 +43,11 @@ class TimeSeriesDatasource(MetOfficeDataSource):
             storage_options=storage_options,
             license=None,
             metadata=metadata,
+            **kwargs,
         )
 
     def _open_dataset(self):
-        self._ds = TimeSeriesDataset(
+        self._dataset = TimeSeriesDataset(
             start_datetime=self.start_datetime,
             end_datetime=self.end_datetime,
             model=self.model,
@@ -62,7 +56,9 @@ class TimeSeriesDatasource(MetOfficeDataSource):
             static_coords=self.static_coords,
             timestep=self.timestep,
             storage_options=self.storage_options,
-        ).ds
+            **self.dataset_options,
+        )
+        self._ds = self._dataset.ds
 
 
 class MetOfficeAQDataSource(MetOfficeDataSource):
@@ -82,13 +78,9 @@ class MetOfficeAQDataSource(MetOfficeDataSource):
         aggregation=None,
         license=None,
         metadata=None,
+        **kwargs,
     ):
 
-        if end_datetime.lower() == "latest":
-            end_datetime = datetime_to_iso_str(
-                (datetime.datetime.now() - datetime.timedelta(hours=48))
-            )
-
         self.aggregation = aggregation
         self.start_datetime = start_datetime
         self.end_datetime = end_datetime
@@ -106,10 +98,11 @@ class MetOfficeAQDataSource(MetOfficeDataSource):
             storage_options=storage_options,
             license=license,
             metadata=metadata,
+            **kwargs,
         )
 
     def _open_dataset(self):
-        self._ds = AQDataset(
+        self._dataset = AQDataset(
             start_datetime=self.start_datetime,
             end_datetime=self.end_datetime,
             model=self.model,
@@ -119,10 +112,15 @@ class MetOfficeAQDataSource(MetOfficeDataSource):
             timestep=self.timestep,
             storage_options=self.storage_options,
             aggregation=self.aggregation,
-        ).ds
+            **self.dataset_options,
+        )
+        self._ds = self._dataset.ds
 
 
 class SingleTimeDataset(MODataset):
+    PREFETCH_DIMS = ("time",)
+    LATEST_FALLBACK_DELAY = pd.Timedelta(hours=48)
+
     def __init__(
         self,
         start_datetime,
@@ -134,17 +132,17 @@ class SingleTimeDataset(MODataset):
         timestep,
         storage_options,
         aggregation=None,
+        **kwargs,
     ):
 
         # remove the 'Z' from the start/end points or xarray struggles...
         self.start_datetime = remove_trailing_z(start_datetime)
-        self.end_datetime = remove_trailing_z(end_datetime)
         self.timestep = timestep
         self.aggregation = aggregation
 
         super().__init__(
             start_cycle=self.start_datetime,
-            end_cycle=self.end_datetime,
+            end_cycle=end_datetime,
             model=model,
             dims=dims,
             diagnostics=diagnostics,
@@ -153,11 +151,17 @@ class SingleTimeDataset(MODataset):
             start_lead_time=None,
             end_lead_time=None,
             lead_time_freq=None,
+            **kwargs,
             **storage_options,
         )
 
     @property
-    def chunks(self):
+    def end_datetime(self):
+        # 'latest' is only known once resolved by MODataset
+        return self.end_cycle
+
+    @property
+    def _file_chunks(self):
         static_coords = self.static_coords
         chunks = {name: static_coords[name].shape[0] for name in static_coords.keys()}
         assert self.timestep in ["1H", "1D"]
@@ -194,11 +198,10 @@ class SingleTimeDataset(MODataset):
             if not all(map(lambda var: var in passed_in, expected)):
                 raise ValueError(f"Expected to find all of {expected} in {var_type}")
 
-    @property
-    def dynamic_coords(self):
+    def _build_dynamic_coords(self):
         dynamic_coords_data = {
             "time": pd.date_range(
-                start=self.start_datetime, end=self.end_datetime, freq=self.timestep
+                start=self.start_datetime, end=self.end_cycle, freq=self.timestep
             )
         }
         return {
@@ -206,21 +209,76 @@ class SingleTimeDataset(MODataset):
             for name, data in dynamic_coords_data.items()
         }
 
-    def _zstore_loader(self, attrs):
-        time = attrs["time"]
-        diag = attrs["variable_name"]
-
-        time = pd.to_datetime(np.datetime64(time, "ns"))
+    def _build_times(self):
+        return pd.DatetimeIndex(self.dynamic_coords["time"].values)
+
+    def _latest_freq(self):
+        # there is a file a day, whatever the timestep
+        return pd.Timedelta(days=1)
+
+    def _latest_probe_url(self, cycle_time):
+        return self._get_blob_url(self.diagnostics[0], time=cycle_time)
+
+    def _latest_end(self, cycle_time):
+        # the last time in the file of that day
+        return cycle_time + pd.Timedelta(days=1) - pd.Timedelta(self.timestep)
+
+    def _inventory_shape(self):
+        times = self._memoized("times", self._build_times)
+        return (-(-len(times) // self._file_chunks["time"]),)
+
+    def _inventory_prefixes(self):
+        # each diagnostic has a directory of its own
+        times = self._memoized("times", self._build_times)
+        prefixes = []
+        for diagnostic in self.diagnostics:
+            url = self._get_blob_url(diagnostic=diagnostic, time=times[0])
+            path = self._url_to_path(url).rsplit("/", 1)[0]
+            prefixes.append((path, [diagnostic], (slice(None),)))
+        return prefixes
+
+    def _build_inventory_names(self):
+        times = self._memoized("times", self._build_times)
+        names = {}
+        for diagnostic in self.diagnostics:
+            for idx, time in enumerate(times[:: self._file_chunks["time"]]):
+                url = self._get_blob_url(diagnostic=diagnostic, time=time)
+                names[url.rsplit("/", 1)[-1]] = (diagnostic, (idx,))
+        return names
+
+    def _inventory_parse(self, name, region):
+        return self._memoized("inventory_names", self._build_inventory_names).get(name)
+
+    def _inventory_index(self, selection):
+        return (selection["time"].start // self._file_chunks["time"],)
+
+    def _expand_availability(self, available):
+        times = self._memoized("times", self._build_times)
+        return np.repeat(available, self._file_chunks["time"])[: len(times)]
+
+    def _file_selection(self, attrs):
+        # the last chunk of a dataset that ends part way through a day only
+        # covers the first times of its file
+        selection = super()._file_selection(attrs) or {}
+        times = attrs["selection"]["time"]
+        per_file = self._file_chunks["time"]
+        if times.stop - times.start < per_file:
+            start = times.start % per_file
+            selection["time"] = slice(start, start + times.stop - times.start)
+        return selection or None
 
-        url = self._get_blob_url(diagnostic=diag, time=time)
-
-        try:
-            data = self._read_from_url(url)
-            data = xr.open_dataset(BytesIO(data))
-            data = self._extract_data_as_dataarray(data)
-            return data.values
-        except FileNotFoundError:
+    def _zstore_loader(self, attrs):
+        if self._known_missing(attrs):
             return None
+        times = self._memoized("times", self._build_times)
+        time = times[attrs["selection"]["time"].start]
+        url = self._get_blob_url(diagnostic=attrs["variable_name"], time=time)
+        return self._load_data(
+            url, self._file_selection(attrs), diagnostic=attrs["variable_name"]
+        )
+
+    def _cache_token(self):
+        return dict(super()._cache_token(), aggregation=self.aggregation)
 
     @staticmethod
     def _extract_data_as_dataarray(dataset):
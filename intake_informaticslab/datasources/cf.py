@@ -0,0 +1,77 @@
+"""CF decoding of variables read straight from HDF5, without xarray.
+
+The reference and decode plan read modes read the raw values of the data
+variable with h5py, so they apply the masking and scaling that xarray
+would have applied themselves, from the attributes recorded here.
+"""
+
+import numpy as np
+import pandas as pd
+
+# CF attributes that xarray applies when decoding
+DECODE_ATTRS = ("_FillValue", "missing_value", "scale_factor", "add_offset")
+
+
+def decode_attrs(dset):
+    """Return the CF decoding attributes of an h5py dataset, as plain values."""
+    return {
+        name: np.asarray(dset.attrs[name]).item()
+        for name in DECODE_ATTRS
+        if name in dset.attrs
+    }
+
+
+def dimension_names(dset):
+    """Return the names of the dims of an h5py dataset (None if not named)."""
+    names = []
+    for dim in dset.dims:
+        if len(dim) == 0:
+            names.append(None)
+            continue
+        names.append(dim[0].name.split("/")[-1])
+    return names
+
+
+def _masked_dtype(dtype):
+    # as xarray's dtypes.maybe_promote, for the dtypes of netCDF variables
+    if dtype.kind == "f":
+        return dtype
+    return np.dtype("float32" if dtype.itemsize <= 2 else "float64")
+
+
+def _scaled_dtype(dtype, has_offset):
+    # as xarray's coding.variables._choose_float_dtype: float32 only where
+    # it holds every value exactly
+    if dtype.kind == "f" and dtype.itemsize <= 4:
+        return np.dtype("float32")
+    if dtype.kind in "iu" and dtype.itemsize <= 2 and not has_offset:
+        return np.dtype("float32")
+    return np.dtype("float64")
+
+
+def decode_cf(data, attrs):
+    """Apply the masking and scaling xarray would apply when decoding.
+
+    The result has the dtype xarray would give it, e.g. float64 for masked
+    or scaled int32 data.
+    """
+    fill_values = [
+        attrs[name]
+        for name in ("_FillValue", "missing_value")
+        if name in attrs and not pd.isnull(attrs[name])
+    ]
+    scale_factor = attrs.get("scale_factor")
+    add_offset = attrs.get("add_offset")
+    if fill_values:
+        data = data.astype(_masked_dtype(data.dtype), copy=False)
+        for fill_value in fill_values:
+            data[data == fill_value] = np.nan
+    if scale_factor is not None or add_offset is not None:
+        data = data.astype(
+            _scaled_dtype(data.dtype, add_offset is not None), copy=False
+        )
+        if scale_factor is not None:
+            data *= scale_factor
+        if add_offset is not None:
+            data += add_offset
+    return data
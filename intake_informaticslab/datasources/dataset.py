@@ -1,23 +1,61 @@
+import hashlib
+import json
 import logging
+import os
+import threading
+from contextlib import contextmanager, nullcontext
 from io import BytesIO
 
 import fsspec
 import numpy as np
 import pandas as pd
 import xarray as xr
-from ..zarrhypothetic.zarrhypothetic import HypotheticZarrStore
+from ..zarrhypothetic.cache import DiskChunkCache, LRUChunkCache
+from ..zarrhypothetic.instrumentation import annotate, timed
+from ..zarrhypothetic.tracing import chrome_trace
+from ..zarrhypothetic.zarrhypothetic import HypotheticZarrCloner, HypotheticZarrStore
+from .inventory import Inventory
+from .decode import DecodePool, PlanMismatch, make_decode_plan, read_with_plan
+from .limiter import AdaptiveLimiter
+from .missing import MissingURLCache
+from .references import ReferenceIndex, read_from_references
+from .retry import RequestPolicy
 from .utils import (
     calc_cycle_validity_lead_times,
     datetime_to_iso_str,
     timedelta_to_duration_str,
     remove_trailing_z,
+    PooledHTTPClient,
 )
 
 logger = logging.getLogger(__name__)
 
 
+READ_MODES = ("download", "lazy", "reference")
+
+DATA_DELAY = 24 + 6  # num hours from current time that data is available
+
+# end cycles resolved from "latest", shared by the datasets of this process
+_LATEST = {}
+_LATEST_LOCK = threading.Lock()
+
+
+def _utcnow():
+    return pd.Timestamp.utcnow().tz_localize(None)
+
+
 # TODO: remove hardcoded assumptions about MOGREPS-UK
 class MODataset:
+    # block size used when reading lazily from within a remote file
+    LAZY_BLOCK_SIZE = 2**20
+    # dims along which data is usually read in sequence
+    PREFETCH_DIMS = ("forecast_period",)
+    # how far back from now to look for the latest data, and where to assume
+    # it ends if none is found
+    LATEST_SEARCH_WINDOW = pd.Timedelta(days=7)
+    LATEST_FALLBACK_DELAY = pd.Timedelta(hours=DATA_DELAY)
+    LATEST_PROBE_TIMEOUT = 10
+
     def __init__(
         self,
         start_cycle,
@@ -30,19 +68,128 @@ class MODataset:
         start_lead_time="0H",
         end_lead_time="126H",
         lead_time_freq="1H",
+        read_mode="download",
+        chunks=None,
+        reference_index=None,
+        memory_cache_bytes=None,
+        cache_dir=None,
+        cache_max_bytes=10 * 2**30,
+        cache_policy="lru",
+        compressor=None,
+        filters=None,
+        max_concurrent_loads=8,
+        prefetch=0,
+        prefetch_max_bytes=2**29,
+        missing_ttl=None,
+        inventory=False,
+        latest_ttl=300,
+        decode_processes=None,
+        adaptive_concurrency=None,
+        retries=3,
+        hedge=False,
+        hooks=None,
         **storage_options,
     ):
         """
+        read_mode is one of 'download' (fetch whole files into memory before
+        decoding) or 'lazy' (open remote files through h5netcdf so that only
+        the HDF5 metadata and the chunks of the data variable are fetched) or
+        'reference' (use reference_index, a ReferenceIndex or the path to one,
+        to read the data chunks with ranged requests and no netCDF parsing;
+        files that are not in the index, or were missing when it was built,
+        are read lazily).
+
+        memory_cache_bytes optionally sets the size of an in-memory LRU cache
+        of loaded chunks, so that repeated reads don't fetch files again.
+
+        cache_dir optionally sets a local directory in which loaded chunks are
+        cached across sessions and processes, limited to cache_max_bytes and
+        evicted by cache_policy ('lru' or 'lfu').
+
+        compressor and filters optionally set the numcodecs codecs (or their
+        config dicts) used to encode chunks, so that cached and cloned chunks
+        are stored compressed, e.g. compressor={"id": "blosc", "cname": "lz4",
+        "shuffle": 1} and filters=[{"id": "bitround", "keepbits": 12}].
+
+        max_concurrent_loads bounds the number of files read at once when a
+        single dask task covers several chunks.
+
+        prefetch optionally sets how many chunks ahead (along forecast_period,
+        or time for time series) to read in the background whenever a chunk
+        is read, holding at most prefetch_max_bytes until they are used.
+
+        missing_ttl optionally sets the number of seconds for which a file
+        that was not found is assumed to still be missing (not requested
+        again), shared by every dataset in the process and kept in cache_dir
+        if that is set. It is off by default because files that are still
+        being published read as missing (all NaN) until the TTL expires, so
+        keep it short (e.g. 60) when reading recent cycles.
+
+        inventory optionally lists the directories holding the dataset's files
+        when it is opened, so that files known to be missing are never
+        requested and a boolean {diagnostic}_available coord marks the files
+        that exist. Call refresh_inventory to pick up files added since.
+
+        end_cycle may be 'latest', which is resolved when the data is first
+        used to the newest cycle whose first file exists (found with a binary
+        search over the last LATEST_SEARCH_WINDOW of cycles) and remembered
+        for latest_ttl seconds by every dataset of the process with the same
+        layout. If nothing is found, the store can't be reached or it doesn't
+        answer within LATEST_PROBE_TIMEOUT seconds, the data is assumed to end
+        LATEST_FALLBACK_DELAY before now.
+
+        decode_processes optionally sets a number of worker processes to
+        decode downloaded files in (with read_mode 'download'), as HDF5
+        decompression holds the GIL and so doesn't scale across threads.
+        Requests are still made on threads.
+
+        adaptive_concurrency optionally (True, or a dict of AdaptiveLimiter
+        arguments such as {"initial": 16, "max_limit": 128}) paces requests
+        with an AIMD window on the number in flight (file reads in every
+        read_mode, directory listings and probes), shared by every dataset
+        of the process reading from the same storage account (or url_prefix)
+        and shrunk when the store throttles requests.
+
+        retries is the number of times a read of a file (whatever the
+        read_mode) that failed with a transient error (not a missing file) is
+        tried again, with exponential backoff and jitter. hedge optionally
+        (True, or a dict of RequestPolicy arguments such as
+        {"hedge_quantile": 0.99}) sends a duplicate of any read that takes
+        longer than the p95 latency of recent ones (not counting the wait for
+        a slot) and uses whichever answers first, for at most about 5% of
+        reads.
+
+        hooks optionally is a list of callables (e.g. a ChunkRecorder) passed
+        a ChunkEvent for every chunk read, with the URL of its file, the bytes
+        downloaded, the time spent fetching, decoding and copying, whether it
+        came from a cache and whether it was found.
+
+        chunks optionally maps static dims (e.g. height, realization or the
+        spatial dims) to a chunk size smaller than the file, so that each
+        chunk only covers (and only reads) part of a file. Dims that are not
+        in this dataset are ignored.
+
         storage_options must contain the keys data_protocol and url_prefix
 
         NB: If using abfs, storage_options should contain the keys
         'account_name' and 'credential'
+
+        storage_options may also contain 'pool_size' (the maximum number of
+        concurrent requests made through the shared filesystem) and
+        'keep_alive' (seconds an idle HTTP connection is kept open).
         """
 
         self._check_dims_coords(dims, static_coords, model)
+        self._coord_cache = {}
+        # decode plans by diagnostic, None if its files can't be read with one
+        self._decode_plans = {}
+        if read_mode not in READ_MODES:
+            raise ValueError(f"read_mode must be one of {READ_MODES}, got {read_mode}")
+        if read_mode == "reference" and reference_index is None:
+            raise ValueError("read_mode 'reference' requires a reference_index")
 
         self.start_cycle = start_cycle
-        self.end_cycle = end_cycle
+        self._end_cycle = end_cycle
         self.model = model
         self.dims = dims
         self.diagnostics = diagnostics
@@ -51,17 +198,42 @@ class MODataset:
         self.start_lead_time = start_lead_time
         self.end_lead_time = end_lead_time
         self.lead_time_freq = lead_time_freq
+        self.read_mode = read_mode
+        self.chunk_overrides = self._check_chunks(chunks or {})
+        self._references = reference_index
+        self.memory_cache_bytes = memory_cache_bytes
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_policy = cache_policy
+        self.compressor = compressor
+        self.filters = filters
+        self.max_concurrent_loads = max_concurrent_loads
+        self.prefetch = prefetch
+        self.prefetch_max_bytes = prefetch_max_bytes
+        self.missing_ttl = missing_ttl
+        self.latest_ttl = latest_ttl
+        self.hooks = list(hooks or [])
+        self._decode_pool = DecodePool(decode_processes) if decode_processes else None
 
         self.data_protocol = storage_options.pop("data_protocol")
         self.url_prefix = storage_options.pop("url_prefix")
+        self.pool_size = storage_options.pop("pool_size", None)
+        self.keep_alive = storage_options.pop("keep_alive", None)
         self.storage_options = storage_options
         self._validate_storage_options()
+        self._limiter = self._create_limiter(adaptive_concurrency)
+        self._requests = self._create_request_policy(retries, hedge)
+        self._init_filesystem_state()
 
         # remove the 'Z' from the start/end points or xarray struggles...
         self.start_cycle = remove_trailing_z(self.start_cycle)
-        self.end_cycle = remove_trailing_z(self.end_cycle)
+        self._end_cycle = remove_trailing_z(self._end_cycle)
 
-        self._zstore = self._create_zstore()
+        self._missing = self._create_missing_cache()
+        # the store and inventory are sized by end_cycle, so they are only
+        # created (and 'latest' resolved) when the data is first used
+        self._inventory = True if inventory else None
+        self._store = None
         self._ds = None
 
     @staticmethod
@@ -120,8 +292,119 @@ class MODataset:
             msg = f"When using 'abfs', storage_options should contain the keys: {ABFS_KEYS}"
             raise KeyError(msg)
 
+    def _init_filesystem_state(self):
+        # the filesystem is created on first use and shared by all loader calls
+        self._fs = None
+        self._fs_lock = threading.Lock()
+        # as are end_cycle, the store and the inventory
+        self._lazy_lock = threading.RLock()
+        self._pool_slots = (
+            threading.BoundedSemaphore(self.pool_size) if self.pool_size else None
+        )
+
+    def __getstate__(self):
+        # locks and live connections can't be pickled (e.g. when dask ships
+        # the store to workers), rebuild them on the other side instead
+        state = self.__dict__.copy()
+        for key in ("_fs", "_fs_lock", "_lazy_lock", "_pool_slots", "_ds"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ds = None
+        self._init_filesystem_state()
+
+    def _filesystem_options(self):
+        """Return the storage options with connection pool settings applied."""
+        options = dict(self.storage_options)
+        if self.pool_size is None and self.keep_alive is None:
+            return options
+
+        protocols = self.data_protocol.split("::")
+        for protocol in protocols:
+            if protocol not in ("http", "https"):
+                continue
+            get_client = PooledHTTPClient(self.pool_size, self.keep_alive)
+            if len(protocols) > 1:
+                options[protocol] = dict(
+                    options.get(protocol, {}), get_client=get_client
+                )
+            else:
+                options["get_client"] = get_client
+        return options
+
+    @property
+    def fs(self):
+        """The fsspec filesystem shared by every request made by this dataset."""
+        if self._fs is None:
+            with self._fs_lock:
+                if self._fs is None:
+                    self._fs, _ = fsspec.core.url_to_fs(
+                        f"{self.data_protocol}://{self.url_prefix}",
+                        **self._filesystem_options(),
+                    )
+        return self._fs
+
+    @property
+    def end_cycle(self):
+        """The last cycle, resolved on first use if it was given as 'latest'."""
+        if self._end_cycle.lower() == "latest":
+            with self._lazy_lock:
+                if self._end_cycle.lower() == "latest":
+                    self._end_cycle = self._resolve_latest()
+        return self._end_cycle
+
+    @property
+    def inventory(self):
+        """The Inventory of the dataset's files (if enabled), built on first use."""
+        if self._inventory is True:
+            with self._lazy_lock:
+                if self._inventory is True:
+                    self._inventory = Inventory(self, self.max_concurrent_loads)
+        return self._inventory
+
+    @property
+    def _zstore(self):
+        if self._store is None:
+            with self._lazy_lock:
+                if self._store is None:
+                    self._store = self._create_zstore()
+        return self._store
+
+    @property
+    def references(self):
+        """The ReferenceIndex used by read_mode 'reference', loaded on first use."""
+        if isinstance(self._references, str):
+            self._references = ReferenceIndex.load(self._references)
+        return self._references
+
+    @staticmethod
+    def _url_to_path(url):
+        """Strip the (possibly chained) protocol from a URL.
+
+        HTTP URLs are kept whole, as that is what HTTP filesystems expect.
+        """
+        url = url.split("::")[-1]
+        if url.startswith(("http://", "https://")):
+            return url
+        return url.split("://", 1)[-1]
+
+    def _memoized(self, name, build):
+        # coords are fixed once the dataset is created, so only build them once
+        if name not in self._coord_cache:
+            self._coord_cache[name] = build()
+        return self._coord_cache[name]
+
     @property
     def static_coords(self):
+        return self._memoized("static_coords", self._build_static_coords)
+
+    @property
+    def dynamic_coords(self):
+        return self._memoized("dynamic_coords", self._build_dynamic_coords)
+
+    def _build_static_coords(self):
         static_coords = {}
         for name, defn in self._static_coords.items():
             data = defn["data"]
@@ -138,8 +421,7 @@ class MODataset:
     def coord_vars(self):
         return dict(self.static_coords, **self.dynamic_coords)
 
-    @property
-    def dynamic_coords(self):
+    def _build_dynamic_coords(self):
         dynamic_coords_data = {
             "forecast_reference_time": pd.date_range(
                 start=self.start_cycle, end=self.end_cycle, freq=self.cycle_freq
@@ -155,11 +437,42 @@ class MODataset:
             for name, data in dynamic_coords_data.items()
         }
 
+    def _check_chunks(self, chunks):
+        """Return the chunk overrides that apply to this dataset's dims."""
+        static_dims = [dim for dim in self.dims if dim in self._static_coords]
+        overrides = {}
+        for dim, size in chunks.items():
+            if dim not in self.dims:
+                continue
+            if dim not in static_dims:
+                raise ValueError(
+                    f"Can only split files along {static_dims}, not along '{dim}'"
+                )
+            if int(size) < 1:
+                raise ValueError(f"Chunk size for '{dim}' must be positive")
+            overrides[dim] = int(size)
+        return overrides
+
     @property
-    def chunks(self):
+    def _file_chunks(self):
+        """Chunk sizes for which one chunk is one whole file."""
         static_coords = self.static_coords
         return {name: static_coords[name].shape[0] for name in static_coords.keys()}
 
+    @property
+    def chunks(self):
+        chunks = self._file_chunks
+        for dim, size in self.chunk_overrides.items():
+            chunks[dim] = min(size, chunks[dim])
+        return chunks
+
+    def _file_selection(self, attrs):
+        """Return the part of a file covered by a chunk, or None for all of it."""
+        if not self.chunk_overrides:
+            return None
+        selection = attrs["selection"]
+        return {dim: selection[dim] for dim in self.chunk_overrides}
+
     def _extract_data_as_dataarray(self, dataset):
 
         REQUIRED_COORD_VARS = []
@@ -225,39 +538,395 @@ class MODataset:
         validity_time = datetime_to_iso_str(validity_time)
         lead_time = timedelta_to_duration_str(lead_time)
 
+        return self._format_url(diagnostic, cycle_time, validity_time, lead_time)
+
+    def _format_url(self, diagnostic, cycle_time, validity_time, lead_time):
         obj_path = (
             f"{self.model}/{cycle_time}/{validity_time}-{lead_time}-{diagnostic}.nc"
         )
         obj_path = f"{self.url_prefix}/{obj_path}"
         return f"{self.data_protocol}://{obj_path}"
 
-    def _read_from_url(self, url, mode="rb"):
+    def _build_url_tables(self):
+        cycle_times = pd.DatetimeIndex(
+            self.dynamic_coords["forecast_reference_time"].values
+        )
+        lead_times = pd.TimedeltaIndex(self.dynamic_coords["forecast_period"].values)
+        return {
+            "cycle_times": cycle_times,
+            "lead_times": lead_times,
+            "cycle_strs": [datetime_to_iso_str(t) for t in cycle_times],
+            "lead_strs": [timedelta_to_duration_str(t) for t in lead_times],
+        }
+
+    def _get_chunk_url(self, diagnostic, cycle_idx, lead_idx):
+        """Return the URL of a forecast file from cycle and lead time indices."""
+        tables = self._memoized("url_tables", self._build_url_tables)
+        validity_time = (
+            tables["cycle_times"][cycle_idx] + tables["lead_times"][lead_idx]
+        )
+        return self._format_url(
+            diagnostic,
+            tables["cycle_strs"][cycle_idx],
+            datetime_to_iso_str(validity_time),
+            tables["lead_strs"][lead_idx],
+        )
+
+    def _inventory_shape(self):
+        tables = self._memoized("url_tables", self._build_url_tables)
+        return (len(tables["cycle_times"]), len(tables["lead_times"]))
+
+    def _inventory_prefixes(self):
+        # every diagnostic of a cycle is in the same directory
+        tables = self._memoized("url_tables", self._build_url_tables)
+        return [
+            (
+                self._url_to_path(
+                    f"{self.data_protocol}://{self.url_prefix}/{self.model}/{cycle_str}"
+                ),
+                self.diagnostics,
+                (cycle_idx, slice(None)),
+            )
+            for cycle_idx, cycle_str in enumerate(tables["cycle_strs"])
+        ]
+
+    def _build_lead_idxs(self):
+        tables = self._memoized("url_tables", self._build_url_tables)
+        return {lead_str: idx for idx, lead_str in enumerate(tables["lead_strs"])}
+
+    def _inventory_parse(self, name, region):
+        # file names are {validity_time}-{lead_time}-{diagnostic}.nc
+        if not name.endswith(".nc"):
+            return None
+        parts = name[: -len(".nc")].split("-", 2)
+        if len(parts) != 3:
+            return None
+        lead_idx = self._memoized("lead_idxs", self._build_lead_idxs).get(parts[1])
+        if lead_idx is None:
+            return None
+        return parts[2], (region[0], lead_idx)
+
+    def _inventory_index(self, selection):
+        return (
+            selection["forecast_reference_time"].start,
+            selection["forecast_period"].start,
+        )
+
+    def _expand_availability(self, available):
+        return available
+
+    def _known_missing(self, attrs):
+        if self.inventory is None:
+            return False
+        index = self._inventory_index(attrs["selection"])
+        return self.inventory.is_missing(attrs["variable_name"], index)
+
+    def availability(self):
+        """Return a boolean {diagnostic}_available variable for each diagnostic.
+
+        They are True where the inventory found the file of a chunk.
+        """
+        if self.inventory is None:
+            raise ValueError("availability requires a dataset with inventory=True")
+        dims = tuple(self.dynamic_coords)
+        return {
+            f"{diagnostic}_available": xr.Variable(
+                dims, self._expand_availability(self.inventory.available(diagnostic))
+            )
+            for diagnostic in self.diagnostics
+        }
+
+    def refresh_inventory(self, full=False):
+        """List the directories that may hold new files and update ds to match."""
+        if self.inventory is None:
+            raise ValueError("refresh_inventory requires inventory=True")
+        self.inventory.refresh(full=full)
+        self._ds = None
+
+    def _latest_freq(self):
+        return pd.Timedelta(self.cycle_freq)
+
+    def _latest_probe_url(self, cycle_time):
+        return self._get_url(
+            self.diagnostics[0],
+            cycle_time=cycle_time,
+            lead_time=pd.Timedelta(self.start_lead_time),
+        )
+
+    def _latest_end(self, cycle_time):
+        return cycle_time
+
+    def _exists(self, url):
+        with self._slots():
+            return self.fs.exists(self._url_to_path(url))
+
+    def _find_latest(self):
+        """Return the newest cycle in the search window that exists, or None.
+
+        Going back from now in doubling steps finds an existing cycle, then
+        (as cycles arrive in order) a binary search between it and the newer
+        missing one finds the latest with a handful of requests.
+        """
+        freq = self._latest_freq()
+        now = _utcnow()
+        candidates = pd.date_range(
+            start=(now - self.LATEST_SEARCH_WINDOW).ceil(freq),
+            end=now.floor(freq),
+            freq=freq,
+        )
+
+        def exists(idx):
+            return self._exists(self._latest_probe_url(candidates[idx]))
+
+        missing, step = len(candidates), 1
+        found = missing - step
+        while found >= 0 and not exists(found):
+            missing, step = found, step * 2
+            found = missing - step
+        if found < 0:
+            if missing == 0 or not exists(0):
+                return None
+            found = 0
+        # candidates[found] exists and candidates[missing] doesn't
+        while missing - found > 1:
+            mid = (found + missing) // 2
+            if exists(mid):
+                found = mid
+            else:
+                missing = mid
+        return candidates[found]
+
+    def _probe_latest(self):
+        # an unreachable store can take minutes to give up (e.g. the retries
+        # of the Azure SDK), so stop waiting after LATEST_PROBE_TIMEOUT - a
+        # daemon thread doesn't keep the interpreter alive while it finishes
+        result = {}
+
+        def probe():
+            try:
+                result["latest"] = self._find_latest()
+            except Exception as e:
+                logger.warning(f"Could not find the latest data: {e}")
+
+        thread = threading.Thread(target=probe, name="latest-probe", daemon=True)
+        thread.start()
+        thread.join(self.LATEST_PROBE_TIMEOUT)
+        if thread.is_alive():
+            logger.warning("Timed out looking for the latest data")
+        return result.get("latest")
+
+    def _resolve_latest(self):
+        # the URL of a fixed cycle identifies the layout (and so the answer)
+        key = (self._latest_probe_url(pd.Timestamp(0)), str(self._latest_freq()))
+        now = _utcnow()
+        if self.latest_ttl:
+            with _LATEST_LOCK:
+                cached = _LATEST.get(key)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+        latest = self._probe_latest()
+        if latest is None:
+            latest = now - self.LATEST_FALLBACK_DELAY
+            logger.info(f"No recent data found, assuming it ends at {latest}")
+        else:
+            latest = self._latest_end(latest)
+        latest = remove_trailing_z(datetime_to_iso_str(latest))
+        if self.latest_ttl:
+            with _LATEST_LOCK:
+                _LATEST[key] = (latest, now + pd.Timedelta(seconds=self.latest_ttl))
+        return latest
+
+    def _limiter_key(self):
+        account = self.storage_options.get("account_name")
+        if account is not None:
+            return f"{self.data_protocol}:{account}"
+        return f"{self.data_protocol}://{self.url_prefix}"
+
+    def _create_limiter(self, adaptive_concurrency):
+        if not adaptive_concurrency:
+            return None
+        config = adaptive_concurrency if isinstance(adaptive_concurrency, dict) else {}
+        return AdaptiveLimiter.shared(self._limiter_key(), **config)
+
+    def _create_request_policy(self, retries, hedge):
+        config = hedge if isinstance(hedge, dict) else {}
+        return RequestPolicy(retries=retries or 0, hedge=bool(hedge), **config)
+
+    def _request_slot(self):
+        return self._limiter.slot() if self._limiter is not None else nullcontext()
+
+    def _connection_slot(self):
+        return self._pool_slots if self._pool_slots is not None else nullcontext()
+
+    @contextmanager
+    def _slots(self):
+        """Hold a slot of the limiter (if any) and of the connection pool."""
+        with self._request_slot(), self._connection_slot():
+            yield
+
+    def _read_from_url(self, url):
         logger.info(f"Request: {url}")
-        with fsspec.open(url, mode, **self.storage_options) as of:
-            data = of.read()
-        return data
+        return self._requests.call(lambda: self._fetch(url), slot=self._slots)
+
+    def _fetch(self, url):
+        return self.fs.cat_file(self._url_to_path(url))
+
+    def _open_url(self, url):
+        """Open a remote file for random access."""
+        logger.info(f"Request (lazy): {url}")
+        return self.fs.open(
+            self._url_to_path(url),
+            "rb",
+            block_size=self.LAZY_BLOCK_SIZE,
+            cache_type="blockcache",
+        )
 
-    def _zstore_loader(self, attrs):
-        ref_time = attrs["forecast_reference_time"]
-        fcst_period = attrs["forecast_period"]
-        diag = attrs["variable_name"]
+    def _read_lazily(self, url, diagnostic, selection):
+        # the ranged reads are made while decoding, so the request covers both
+        def read():
+            with self._open_url(url) as of:
+                return self._decode(of, diagnostic, selection, "h5netcdf")
+
+        return self._requests.call(read, slot=self._slots)
 
-        ref_time = pd.to_datetime(np.datetime64(ref_time, "ns"))
-        fcst_period = pd.to_timedelta(np.timedelta64(fcst_period, "ns"))
+    def _select_values(self, dataset, selection=None):
+        data = self._extract_data_as_dataarray(dataset)
+        if selection:
+            data = data.isel(selection, missing_dims="ignore")
+        return data.values
 
-        url = self._get_url(diagnostic=diag, cycle_time=ref_time, lead_time=fcst_period)
+    def _decode(self, fileobj, diagnostic=None, selection=None, engine=None):
+        """Return the selected values of the data variable of an open file.
 
+        The first file of a diagnostic is decoded with xarray, which is also
+        used to find its data variable, and a decode plan is made from it so
+        that later files are read with h5py directly (in the decode pool if
+        there is one).
+        """
+        plan = self._decode_plans.get(diagnostic)
+        if plan is not None:
+            try:
+                if self._decode_pool is not None and isinstance(fileobj, BytesIO):
+                    # getvalue doesn't copy the bytes the BytesIO was made from
+                    return self._decode_pool.read(fileobj.getvalue(), plan, selection)
+                return read_with_plan(fileobj, plan, selection)
+            except (PlanMismatch, OSError) as e:
+                logger.info(f"Reading with xarray, not the decode plan: {e}")
+                fileobj.seek(0)
+        with xr.open_dataset(fileobj, engine=engine) as data:
+            values = self._select_values(data, selection)
+            variable = self._extract_data_as_dataarray(data).name
+        if diagnostic is not None and diagnostic not in self._decode_plans:
+            self._decode_plans[diagnostic] = self._make_decode_plan(fileobj, variable)
+        return values
+
+    @staticmethod
+    def _make_decode_plan(fileobj, variable):
         try:
-            data = self._read_from_url(url)
-            data = xr.open_dataset(BytesIO(data))
-            data = self._extract_data_as_dataarray(data)
-            return data.values
+            fileobj.seek(0)
+            return make_decode_plan(fileobj, variable)
+        except (ImportError, OSError, KeyError) as e:
+            # e.g. netCDF3 files, which are always read with xarray
+            logger.info(f"No decode plan for {variable}: {e}")
+            return None
+
+    def _load_data(self, url, selection=None, diagnostic=None):
+        """Return the data variable of the file at url as a numpy array.
+
+        selection optionally maps dims to the index slices to read. Files of
+        the same diagnostic are read with a decode plan made from the first.
+        Returns None if the file does not exist.
+        """
+        annotate(url=url)
+        if self._missing is not None and url in self._missing:
+            logger.info(f"NOT FOUND (cached): {url}")
+            return None
+        try:
+            # files that were missing when indexed are read lazily, in case
+            # they have been published since
+            entry = self.references.get(url) if self.read_mode == "reference" else None
+            if entry is not None:
+                logger.info(f"Request (reference): {url}")
+                with timed("fetch"):
+                    return self._requests.call(
+                        lambda: read_from_references(
+                            self.fs, self._url_to_path(url), entry, selection
+                        ),
+                        slot=self._slots,
+                    )
+            if self.read_mode in ("lazy", "reference"):
+                # ranged reads are made while decoding, so that is all 'decode'
+                with timed("decode"):
+                    return self._read_lazily(url, diagnostic, selection)
+            with timed("fetch"):
+                data = self._read_from_url(url)
+            annotate(nbytes=len(data))
+            with timed("decode"):
+                return self._decode(BytesIO(data), diagnostic, selection)
         except FileNotFoundError:
             logger.info(f"NOT FOUND: {url}")
+            if self._missing is not None:
+                self._missing.add(url)
+            return None
+
+    def _zstore_loader(self, attrs):
+        if self._known_missing(attrs):
+            return None
+        selection = attrs["selection"]
+        url = self._get_chunk_url(
+            diagnostic=attrs["variable_name"],
+            cycle_idx=selection["forecast_reference_time"].start,
+            lead_idx=selection["forecast_period"].start,
+        )
+        return self._load_data(
+            url, self._file_selection(attrs), diagnostic=attrs["variable_name"]
+        )
+
+    def _cache_token(self):
+        """Describe everything that determines the content of a data chunk."""
+        return {
+            "class": type(self).__name__,
+            "model": self.model,
+            "data_protocol": self.data_protocol,
+            "url_prefix": self.url_prefix,
+            "start_cycle": self.start_cycle,
+            "cycle_freq": self.cycle_freq,
+            "start_lead_time": self.start_lead_time,
+            "lead_time_freq": self.lead_time_freq,
+            "dims": list(self.dims),
+            "static_coords": self._static_coords,
+            "chunks": self.chunks,
+            "encoding": [self._zstore_codec_config(self.compressor)]
+            + [self._zstore_codec_config(codec) for codec in self.filters or []],
+        }
+
+    @staticmethod
+    def _zstore_codec_config(codec):
+        if codec is None or isinstance(codec, dict):
+            return codec
+        return codec.get_config()
+
+    def _create_disk_cache(self):
+        # chunk keys are only meaningful for one set of coords (and chunks), so
+        # keep chunks of differently defined datasets in separate directories
+        token = json.dumps(self._cache_token(), sort_keys=True, default=str)
+        namespace = hashlib.sha256(token.encode()).hexdigest()[:16]
+        return DiskChunkCache(
+            os.path.join(self.cache_dir, namespace),
+            max_bytes=self.cache_max_bytes,
+            policy=self.cache_policy,
+        )
+
+    def _create_missing_cache(self):
+        if not self.missing_ttl:
             return None
+        path = None
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, "missing.json")
+        return MissingURLCache.shared(self.missing_ttl, path)
 
     def _create_zstore(self):
-        return HypotheticZarrStore(
+        store_kwargs = dict(
             dims=self.dims,
             coord_vars=self.coord_vars,
             data_vars=self.diagnostics,
@@ -265,12 +934,63 @@ class MODataset:
             loader_function=self._zstore_loader,
             attrs=None,
             dtypes=None,
+            cache=(
+                LRUChunkCache(self.memory_cache_bytes)
+                if self.memory_cache_bytes
+                else None
+            ),
+            compressor=self.compressor,
+            filters=self.filters,
+            max_concurrent_loads=self.max_concurrent_loads,
+            prefetch_dims=self.PREFETCH_DIMS,
+            prefetch_depth=self.prefetch,
+            prefetch_max_bytes=self.prefetch_max_bytes,
+            hooks=self.hooks,
+        )
+        if self.cache_dir is None:
+            return HypotheticZarrStore(**store_kwargs)
+        return HypotheticZarrCloner(
+            self._create_disk_cache(), data_only=True, **store_kwargs
         )
 
+    def cache_info(self):
+        """Return statistics of the chunk caches, prefetcher, requests and so on.
+
+        The statistics of a cache that is not enabled are None.
+        """
+        memory = self._zstore.cache
+        disk = getattr(self._zstore, "target", None)
+        prefetcher = self._zstore.prefetcher
+        return {
+            "memory": memory.info() if memory is not None else None,
+            "disk": disk.info() if disk is not None else None,
+            "prefetch": prefetcher.info() if prefetcher is not None else None,
+            "missing": self._missing.info() if self._missing is not None else None,
+            "limiter": self._limiter.info() if self._limiter is not None else None,
+            "requests": self._requests.info(),
+            "inventory": (
+                self.inventory.info() if self.inventory is not None else None
+            ),
+        }
+
+    def trace(self, path):
+        """Return a context manager writing a Chrome trace of chunk loads to path.
+
+        Every chunk read (e.g. by computing) within the block is drawn as a
+        span on the thread that read it, with its queued, fetch, decode and
+        copy phases underneath. Open path in chrome://tracing or Perfetto.
+        """
+        return chrome_trace(path, self.hooks)
+
     @property
     def ds(self):
         if self._ds is None:
-            self._ds = xr.open_zarr(self._zstore, consolidated=True)
+            ds = xr.open_zarr(self._zstore, consolidated=True)
+            if self.inventory is not None:
+                if not self.inventory.listings:
+                    self.inventory.refresh()
+                ds = ds.assign_coords(self.availability())
+            self._ds = ds
         return self._ds
 
     def to_xarray(self):
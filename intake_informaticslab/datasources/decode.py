@@ -0,0 +1,148 @@
+"""Decode plans for reading the data variable of forecast files with h5py.
+
+Opening a file with xarray decodes every coordinate and all of the CF
+metadata, and finding the data variable means comparing the names of all
+variables against the known coordinate names. Every file of a diagnostic
+has the same layout though, so the first file is opened with xarray and
+what was learnt is kept as a plan: the name and HDF5 path of the data
+variable, its dims, shape, dtype and CF decoding attributes. The remaining
+files are then read by indexing that one HDF5 dataset directly, optionally
+in a pool of worker processes (DecodePool). A file that doesn't match the
+plan is read with xarray instead.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+
+from .cf import decode_attrs, decode_cf, dimension_names
+
+
+class PlanMismatch(ValueError):
+    """A file does not have the layout recorded in a decode plan."""
+
+
+def make_decode_plan(fileobj, variable):
+    """Return the decode plan of a variable of an open HDF5 (netCDF4) file."""
+    import h5py
+
+    with h5py.File(fileobj, "r") as f:
+        dset = f[variable]
+        return {
+            "variable": variable,
+            "path": dset.name,
+            "dims": dimension_names(dset),
+            "shape": list(dset.shape),
+            "dtype": dset.dtype.str,
+            "attrs": decode_attrs(dset),
+        }
+
+
+def read_with_plan(fileobj, plan, selection=None):
+    """Read (part of) the variable of a plan from an open HDF5 file.
+
+    selection optionally maps dim names to index slices. Raises
+    PlanMismatch if the variable isn't as described by the plan.
+    """
+    import h5py
+
+    selection = selection or {}
+    with h5py.File(fileobj, "r") as f:
+        try:
+            dset = f[plan["path"]]
+        except KeyError:
+            raise PlanMismatch(f"No variable {plan['path']}")
+        if (
+            dset.dtype.str != plan["dtype"]
+            or list(dset.shape) != plan["shape"]
+            or dimension_names(dset) != plan["dims"]
+        ):
+            raise PlanMismatch(f"Unexpected layout of {plan['path']}")
+        index = tuple(selection.get(dim, slice(None)) for dim in plan["dims"])
+        data = dset[index]
+    return decode_cf(data, plan["attrs"])
+
+
+def _read_shared(name, size, plan, selection=None):
+    """Worker side of DecodePool.read, results are left in shared memory."""
+    from multiprocessing.shared_memory import SharedMemory
+
+    shm = SharedMemory(name=name)
+    try:
+        with shm.buf[:size] as view:
+            fileobj = BytesIO(view)
+        data = np.ascontiguousarray(read_with_plan(fileobj, plan, selection))
+    finally:
+        shm.close()
+    out = SharedMemory(create=True, size=max(1, data.nbytes))
+    np.ndarray(data.shape, data.dtype, buffer=out.buf)[...] = data
+    out.close()
+    return out.name, data.shape, data.dtype.str
+
+
+class DecodePool:
+    """Decode files with their decode plan in a pool of worker processes.
+
+    HDF5 decompression holds the GIL, so decoding on threads doesn't scale
+    with cores. The file contents go to the workers, and the decoded arrays
+    come back, through shared memory rather than being pickled through a
+    pipe. Workers are spawned (not forked, which HDF5 doesn't survive well)
+    on first use.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._init_state()
+
+    def _init_state(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"processes": self.processes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        self.processes, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def read(self, data, plan, selection=None):
+        """Like read_with_plan, for the contents of a file (a bytes-like)."""
+        from multiprocessing.shared_memory import SharedMemory
+
+        size = memoryview(data).nbytes
+        shm = SharedMemory(create=True, size=max(1, size))
+        try:
+            shm.buf[:size] = data
+            future = self.executor.submit(_read_shared, shm.name, size, plan, selection)
+            name, shape, dtype = future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+        out = SharedMemory(name=name)
+        try:
+            view = np.ndarray(shape, dtype, buffer=out.buf)
+            values = view.copy()
+            del view
+        finally:
+            out.close()
+            out.unlink()
+        return values
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
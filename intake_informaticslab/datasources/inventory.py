@@ -0,0 +1,107 @@
+"""Availability index of the files of a dataset, built from bulk listings.
+
+Rather than finding out that a file is missing by requesting it, the
+directories holding a dataset's files (one per cycle for forecasts, one
+per diagnostic for the AQ and UKV time series) are listed and the names
+found are turned into an index of which files exist.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = -1
+MISSING = 0
+AVAILABLE = 1
+
+
+class Inventory:
+    """Know which files of a dataset exist, by listing their directories.
+
+    The dataset describes its layout through three methods:
+
+    - ``_inventory_shape()``: the shape of the index of files of one
+      diagnostic, e.g. (number of cycles, number of lead times)
+    - ``_inventory_prefixes()``: a list of (path, diagnostics, region) for
+      every directory to list, where region is the (tuple of slices) part of
+      the index of those diagnostics that the directory holds
+    - ``_inventory_parse(name, region)``: the (diagnostic, index) of a file
+      name found in the directory of region, or None if it isn't a file of
+      the dataset
+
+    The index keeps one int8 per file: UNKNOWN until its directory has been
+    listed, then MISSING or AVAILABLE.
+    """
+
+    def __init__(self, dataset, max_workers=8):
+        self.dataset = dataset
+        self.max_workers = max_workers
+        shape = dataset._inventory_shape()
+        self.state = {
+            diagnostic: np.full(shape, UNKNOWN, dtype="int8")
+            for diagnostic in dataset.diagnostics
+        }
+        self.listings = 0
+
+    def _list(self, path):
+        with self.dataset._slots():
+            try:
+                paths = self.dataset.fs.ls(path, detail=False)
+            except FileNotFoundError:
+                paths = []
+        return [path.rstrip("/").rsplit("/", 1)[-1] for path in paths]
+
+    def _is_complete(self, diagnostics, region):
+        return all((self.state[d][region] == AVAILABLE).all() for d in diagnostics)
+
+    def refresh(self, full=False):
+        """List the directories that may hold files not yet known to exist.
+
+        Directories whose files were all found are only listed again when
+        full is True.
+        """
+        prefixes = [
+            (path, diagnostics, region)
+            for path, diagnostics, region in self.dataset._inventory_prefixes()
+            if full or not self._is_complete(diagnostics, region)
+        ]
+        if not prefixes:
+            return self
+        logger.info(f"Listing {len(prefixes)} directories")
+        num_workers = max(1, min(self.max_workers, len(prefixes)))
+        with ThreadPoolExecutor(num_workers) as executor:
+            listings = executor.map(self._list, [path for path, _, _ in prefixes])
+            for (_, diagnostics, region), names in zip(prefixes, listings):
+                self._update(diagnostics, region, names)
+        return self
+
+    def _update(self, diagnostics, region, names):
+        for diagnostic in diagnostics:
+            self.state[diagnostic][region] = MISSING
+        for name in names:
+            parsed = self.dataset._inventory_parse(name, region)
+            if parsed is None:
+                continue
+            diagnostic, index = parsed
+            if diagnostic in self.state:
+                self.state[diagnostic][index] = AVAILABLE
+        self.listings += 1
+
+    def is_missing(self, diagnostic, index):
+        """Whether the file is known not to exist (False if not listed yet)."""
+        return self.state[diagnostic][index] == MISSING
+
+    def available(self, diagnostic):
+        """Boolean array of the files of diagnostic that are known to exist."""
+        return self.state[diagnostic] == AVAILABLE
+
+    def info(self):
+        counts = {"available": 0, "missing": 0, "unknown": 0}
+        for state in self.state.values():
+            counts["available"] += int((state == AVAILABLE).sum())
+            counts["missing"] += int((state == MISSING).sum())
+            counts["unknown"] += int((state == UNKNOWN).sum())
+        return dict(counts, listings=self.listings)
@@ -0,0 +1,220 @@
+"""Adaptive (AIMD) limit on the number of requests in flight to a store.
+
+Blob stores throttle accounts that send more requests than they can serve,
+and a throttled client gets less done than one that paces itself. Like TCP
+congestion control, the window of requests in flight grows by about one
+per round-trip while requests succeed and is cut by a factor when the store
+throttles (or, optionally, latency climbs well above the best seen), at most
+once per round-trip so that a burst of errors from one overload only counts
+once.
+"""
+
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+# limiters shared by every dataset of this process, keyed by account
+_SHARED = {}
+_SHARED_LOCK = threading.Lock()
+
+# HTTP statuses and (Azure / S3) error codes of throttled requests
+THROTTLE_STATUSES = (429, 503)
+THROTTLE_CODES = ("ServerBusy", "OperationTimedOut", "SlowDown", "TooManyRequests")
+
+
+def is_throttled(error):
+    """Whether an exception raised by a filesystem means 'slow down'."""
+    for attr in ("status", "status_code"):
+        if getattr(error, attr, None) in THROTTLE_STATUSES:
+            return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) in THROTTLE_STATUSES:
+        return True
+    code = getattr(error, "error_code", None) or getattr(error, "code", None)
+    if code in THROTTLE_CODES:
+        return True
+    return any(code in str(error) for code in THROTTLE_CODES)
+
+
+class AdaptiveLimiter:
+    """Thread-safe AIMD window on the number of concurrent requests.
+
+    The window starts at initial and stays within [min_limit, max_limit].
+    Each successful request grows it by increase / window (so by about
+    increase per round-trip). A throttled request shrinks it by decrease.
+
+    latency_factor optionally also shrinks it on a success while the
+    (smoothed) latency is more than latency_factor times the fastest seen.
+    This is off by default as the limiter doesn't know the size of requests,
+    so reads of files much larger than the smallest would count as slow;
+    only use it for stores whose files are all of about the same size.
+    """
+
+    def __init__(
+        self,
+        initial=16,
+        min_limit=1,
+        max_limit=256,
+        increase=1.0,
+        decrease=0.5,
+        latency_factor=None,
+    ):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.key = None
+        self._init_state()
+
+    def _init_state(self):
+        self._cond = threading.Condition()
+        self.limit = float(self.initial)
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.slow = 0
+        self.decreases = 0
+        self.waits = 0
+        self.latency = None
+        self.min_latency = None
+        self._last_decrease = 0.0
+
+    @property
+    def config(self):
+        return {
+            "initial": self.initial,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "increase": self.increase,
+            "decrease": self.decrease,
+            "latency_factor": self.latency_factor,
+        }
+
+    @classmethod
+    def shared(cls, key, **config):
+        """Return the limiter of key (e.g. a storage account) for this process.
+
+        config only applies to the call that creates the limiter; later calls
+        asking for a different config get the existing limiter and a warning.
+        """
+        with _SHARED_LOCK:
+            if key not in _SHARED:
+                limiter = cls(**config)
+                limiter.key = key
+                _SHARED[key] = limiter
+                return limiter
+            limiter = _SHARED[key]
+        differing = {
+            name: value
+            for name, value in config.items()
+            if limiter.config.get(name) != value
+        }
+        if differing:
+            warnings.warn(
+                f"the limiter of {key} was already created with {limiter.config}, "
+                f"ignoring {differing}",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+        return limiter
+
+    def __reduce__(self):
+        # unpickled limiters (e.g. on dask workers) join that process' limiter
+        if self.key is None:
+            return (type(self), tuple(self.config.values()))
+        return (_shared_limiter, (self.key, self.config))
+
+    def acquire(self):
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                self.waits += 1
+                while self.in_flight >= int(self.limit):
+                    self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, throttled=False):
+        """Give back a slot, adjusting the window to how the request went.
+
+        latency is None for requests that failed for other reasons, which
+        leave the window as it is.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self.requests += 1
+            if throttled:
+                self.throttled += 1
+                self._shrink()
+            elif latency is not None:
+                self._observe(latency)
+            self._cond.notify_all()
+
+    def _observe(self, latency):
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += 0.1 * (latency - self.latency)
+        # the smoothed latency, so that one large file doesn't count as slow
+        if (
+            self.latency_factor is not None
+            and self.latency > self.latency_factor * self.min_latency
+        ):
+            self.slow += 1
+            self._shrink()
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def _shrink(self):
+        # only once per round-trip, however many requests it affected
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.decreases += 1
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of one request."""
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except FileNotFoundError:
+            # a normal answer, but its latency says nothing about file reads
+            self.release()
+            raise
+        except Exception as e:
+            self.release(throttled=is_throttled(e))
+            raise
+        else:
+            self.release(time.monotonic() - start)
+
+    def info(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "slow": self.slow,
+                "decreases": self.decreases,
+                "waits": self.waits,
+                "latency": self.latency,
+                "min_latency": self.min_latency,
+            }
+
+
+def _shared_limiter(key, config):
+    return AdaptiveLimiter.shared(key, **config)
+
+
+def limiter_info():
+    """Return the statistics of every shared limiter of this process."""
+    with _SHARED_LOCK:
+        limiters = dict(_SHARED)
+    return {key: limiter.info() for key, limiter in limiters.items()}
@@ -0,0 +1,147 @@
+"""Negative cache of forecast files that were found not to exist.
+
+Archives have gaps (cycles that were never run, days missing from the AQ
+archive) and every read of a missing file costs a full round-trip to the
+store. URLs that raised FileNotFoundError are remembered for ttl seconds
+so that repeated scans over a gap return straight away. Files can appear
+later (e.g. the latest cycle is still being uploaded), hence the TTL.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+import weakref
+
+# caches shared by every dataset of this process, keyed by (path, ttl)
+_SHARED = {}
+_SHARED_LOCK = threading.Lock()
+# caches with a path, whose pending entries are written when Python exits
+_PERSISTENT = weakref.WeakSet()
+
+
+class MissingURLCache:
+    """Thread-safe set of missing URLs whose entries expire after ttl seconds.
+
+    If path is given the entries are also kept in a JSON file there, which
+    is merged with the entries of other processes every time it is written.
+    New entries are written in batches, FLUSH_DELAY seconds after the first
+    of them (or by flush, or when Python exits), rather than on every miss.
+    """
+
+    TMP_SUFFIX = ".tmp"
+    FLUSH_DELAY = 5.0
+
+    def __init__(self, ttl, path=None):
+        self.ttl = ttl
+        self.path = os.path.abspath(path) if path is not None else None
+        self._lock = threading.Lock()
+        self._expiries = self._load() if self.path is not None else {}
+        self._dirty = False
+        self._timer = None
+        self.hits = 0
+        self.additions = 0
+        if self.path is not None:
+            _PERSISTENT.add(self)
+
+    @classmethod
+    def shared(cls, ttl, path=None):
+        """Return the cache for (path, ttl) shared by the whole process."""
+        key = (os.path.abspath(path) if path is not None else None, ttl)
+        with _SHARED_LOCK:
+            if key not in _SHARED:
+                _SHARED[key] = cls(ttl, path)
+            return _SHARED[key]
+
+    def __reduce__(self):
+        # unpickled caches (e.g. on dask workers) join that process' cache
+        return (_shared_cache, (self.ttl, self.path))
+
+    def __contains__(self, url):
+        now = time.time()
+        with self._lock:
+            expiry = self._expiries.get(url)
+            if expiry is None:
+                return False
+            if expiry <= now:
+                del self._expiries[url]
+                return False
+            self.hits += 1
+            return True
+
+    def __len__(self):
+        now = time.time()
+        with self._lock:
+            return sum(1 for expiry in self._expiries.values() if expiry > now)
+
+    def add(self, url):
+        with self._lock:
+            self._expiries[url] = time.time() + self.ttl
+            self.additions += 1
+            if self.path is not None:
+                self._dirty = True
+                if self._timer is None:
+                    self._timer = threading.Timer(self.FLUSH_DELAY, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def flush(self):
+        """Write the entries added since the last write to path."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._dirty = False
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._expiries.clear()
+            self._dirty = False
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                expiries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        now = time.time()
+        return {url: expiry for url, expiry in expiries.items() if expiry > now}
+
+    def _save(self):
+        # merge in what other processes found, then write and rename so that
+        # readers never see a partial file
+        now = time.time()
+        for url, expiry in self._load().items():
+            if expiry > self._expiries.get(url, 0):
+                self._expiries[url] = expiry
+        self._expiries = {
+            url: expiry for url, expiry in self._expiries.items() if expiry > now
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}{self.TMP_SUFFIX}"
+        with open(tmp_path, "w") as f:
+            json.dump(self._expiries, f)
+        os.replace(tmp_path, self.path)
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "additions": self.additions,
+            "entries": len(self),
+            "ttl": self.ttl,
+        }
+
+
+def _shared_cache(ttl, path):
+    return MissingURLCache.shared(ttl, path)
+
+
+@atexit.register
+def _flush_all():
+    for cache in list(_PERSISTENT):
+        cache.flush()
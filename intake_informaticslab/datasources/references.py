@@ -0,0 +1,227 @@
+"""Byte-offset reference index for the HDF5 chunks inside forecast files.
+
+Building an index opens every file once to record where the chunks of its
+data variable live, how large they are and how they are encoded. Reading
+with ``read_mode="reference"`` then turns a chunk request into ranged reads
+of exactly those bytes, with no netCDF parsing on the hot path.
+"""
+
+import json
+import logging
+import os
+
+import numcodecs
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .cf import decode_attrs, decode_cf, dimension_names
+from .utils import remove_trailing_z
+
+logger = logging.getLogger(__name__)
+
+# HDF5 filters that can be decoded from raw chunk bytes
+_SUPPORTED_COMPRESSION = (None, "gzip")
+
+
+class ReferenceIndex:
+    """Map file URLs to the location and encoding of their data chunks.
+
+    Each entry is either None (the file didn't exist when it was indexed,
+    so it is looked for again when the index is extended and read lazily
+    until then) or a dict with the data variable's name, dims, shape, dtype,
+    HDF5 chunk shape, filters (numcodecs configs in the order HDF5 applies
+    them on write), HDF5 fill value, CF decoding attributes and ``refs``
+    mapping chunk keys to ``[byte_offset, size, filter_mask]``.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path=None, files=None):
+        self.path = path
+        self.files = files if files is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        """Load an index from a local JSON file, or start an empty one."""
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path) as f:
+            content = json.load(f)
+        if content.get("version") != cls.VERSION:
+            raise ValueError(f"Unsupported reference index version in {path}")
+        return cls(path, content["files"])
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the reference index to")
+        # write then rename so that readers never see a partial index
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.VERSION, "files": self.files}, f)
+        os.replace(tmp_path, path)
+        self.path = path
+
+    def __contains__(self, url):
+        return url in self.files
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, url, default=None):
+        return self.files.get(url, default)
+
+    def add_file(self, url, fileobj, variable):
+        """Index the data variable of an open (HDF5 based) netCDF file."""
+        self.files[url] = index_hdf5_variable(fileobj, variable)
+
+    def add_missing(self, url):
+        self.files[url] = None
+
+    def add_cycle(self, dataset, cycle_time):
+        """Index every file of a MODataset for one forecast cycle."""
+        cycle_time = pd.Timestamp(cycle_time)
+        lead_times = dataset.dynamic_coords["forecast_period"].values
+        for diagnostic in dataset.diagnostics:
+            for lead_time in pd.to_timedelta(lead_times):
+                url = dataset._get_url(
+                    diagnostic=diagnostic, cycle_time=cycle_time, lead_time=lead_time
+                )
+                # files that were missing may have been published since
+                if self.files.get(url) is not None:
+                    continue
+                try:
+                    with dataset.fs.open(dataset._url_to_path(url), "rb") as of:
+                        with xr.open_dataset(of, engine="h5netcdf") as ds:
+                            variable = dataset._extract_data_as_dataarray(ds).name
+                        of.seek(0)
+                        self.add_file(url, of, variable)
+                except FileNotFoundError:
+                    self.add_missing(url)
+                except ValueError as e:
+                    # e.g. unsupported filters, left for lazy reads to decode
+                    logger.warning(f"Not indexing {url}: {e}")
+
+
+def build_reference_index(dataset, path, start_cycle=None, end_cycle=None):
+    """Extend the index at path with the cycles of a MODataset and save it.
+
+    Cycles default to the dataset's own range; files that are already in
+    the index are not opened again, but files that were missing are.
+    """
+    index = ReferenceIndex.load(path)
+    cycles = dataset.dynamic_coords["forecast_reference_time"].values
+    cycles = pd.to_datetime(cycles)
+    if start_cycle is not None:
+        cycles = cycles[cycles >= pd.Timestamp(remove_trailing_z(start_cycle))]
+    if end_cycle is not None:
+        cycles = cycles[cycles <= pd.Timestamp(remove_trailing_z(end_cycle))]
+    for cycle in cycles:
+        logger.info(f"Indexing cycle {cycle}")
+        index.add_cycle(dataset, cycle)
+        index.save()
+    return index
+
+
+def index_hdf5_variable(fileobj, variable):
+    """Return the reference entry for one variable of an HDF5 file."""
+    import h5py
+
+    with h5py.File(fileobj, "r") as f:
+        dset = f[variable]
+        if (
+            dset.compression not in _SUPPORTED_COMPRESSION
+            or dset.fletcher32
+            or dset.scaleoffset is not None
+        ):
+            raise ValueError(f"Unsupported HDF5 filters on {variable}")
+
+        filters = []
+        if dset.shuffle:
+            filters.append({"id": "shuffle", "elementsize": dset.dtype.itemsize})
+        if dset.compression == "gzip":
+            filters.append({"id": "zlib", "level": dset.compression_opts})
+
+        refs = {}
+        if dset.chunks is None:
+            offset = dset.id.get_offset()
+            if offset is not None:
+                key = ".".join("0" for _ in dset.shape)
+                refs[key] = [offset, dset.id.get_storage_size(), 0]
+            chunks = dset.shape
+        else:
+            chunks = dset.chunks
+            for i in range(dset.id.get_num_chunks()):
+                info = dset.id.get_chunk_info(i)
+                idx = (o // c for o, c in zip(info.chunk_offset, chunks))
+                key = ".".join(str(x) for x in idx)
+                refs[key] = [info.byte_offset, info.size, info.filter_mask]
+
+        return {
+            "variable": variable,
+            "dims": dimension_names(dset),
+            "shape": list(dset.shape),
+            "dtype": dset.dtype.str,
+            "chunks": list(chunks),
+            "filters": filters,
+            "fill_value": np.asarray(dset.fillvalue).item(),
+            "attrs": decode_attrs(dset),
+            "refs": refs,
+        }
+
+
+def read_from_references(fs, path, entry, selection=None):
+    """Read (part of) a variable using ranged reads of its chunks.
+
+    selection optionally maps dim names to index slices.
+    """
+    shape = entry["shape"]
+    chunks = entry["chunks"]
+    dtype = np.dtype(entry["dtype"])
+    selection = selection or {}
+    slices = tuple(
+        selection.get(dim, slice(0, size)) if dim is not None else slice(0, size)
+        for dim, size in zip(entry["dims"], shape)
+    )
+    slices = tuple(slice(*sl.indices(size)[:2]) for sl, size in zip(slices, shape))
+
+    # HDF5 chunks that overlap the selection
+    chunk_ranges = [
+        range(sl.start // c, -(-sl.stop // c)) for sl, c in zip(slices, chunks)
+    ]
+    keys, starts, ends, masks = [], [], [], []
+    for idx in np.ndindex(*(len(r) for r in chunk_ranges)):
+        chunk_idx = tuple(r[i] for r, i in zip(chunk_ranges, idx))
+        ref = entry["refs"].get(".".join(str(x) for x in chunk_idx))
+        if ref is None:
+            continue
+        offset, size, mask = ref
+        keys.append(chunk_idx)
+        starts.append(offset)
+        ends.append(offset + size)
+        masks.append(mask)
+
+    out = np.full(
+        tuple(sl.stop - sl.start for sl in slices), entry["fill_value"], dtype=dtype
+    )
+    # raise (rather than return) errors, so that transient ones are retried
+    blocks = (
+        fs.cat_ranges([path] * len(keys), starts, ends, on_error="raise")
+        if keys
+        else []
+    )
+    codecs = [numcodecs.get_codec(dict(config)) for config in entry["filters"]]
+    for chunk_idx, block, mask in zip(keys, blocks, masks):
+        for i, codec in reversed(list(enumerate(codecs))):
+            # bit i of the filter mask is set if filter i was skipped
+            if not mask & (1 << i):
+                block = codec.decode(block)
+        block = np.frombuffer(block, dtype=dtype).reshape(chunks)
+        src, dst = [], []
+        for i, sl, c in zip(chunk_idx, slices, chunks):
+            lo, hi = max(sl.start, i * c), min(sl.stop, (i + 1) * c)
+            src.append(slice(lo - i * c, hi - i * c))
+            dst.append(slice(lo - sl.start, hi - sl.start))
+        out[tuple(dst)] = block[tuple(src)]
+    return decode_cf(out, entry["attrs"])
@@ -0,0 +1,211 @@
+"""Retries with backoff and hedged requests for reads from the store.
+
+A transient error (a dropped connection, a timeout, a throttled or 5xx
+response) is retried after an exponential backoff with full jitter, so that
+many clients failing together don't retry together. Hedging deals with the
+tail: once a request has taken longer than the p95 latency of recent ones
+a duplicate is sent and whichever answers first is used.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+from .limiter import is_throttled
+
+# answers from the store that retrying won't change
+_PERMANENT_ERRORS = (FileNotFoundError, PermissionError, IsADirectoryError)
+# transient errors of the clients fsspec filesystems use, by class name so
+# that none of them has to be installed
+_TRANSIENT_ERROR_NAMES = (
+    "ClientError",  # aiohttp
+    "ServiceRequestError",  # azure
+    "ServiceResponseError",  # azure
+    "IncompleteReadError",  # asyncio
+)
+
+
+def is_retryable(error):
+    """Whether a request that raised error may succeed if tried again."""
+    if isinstance(error, _PERMANENT_ERRORS):
+        return False
+    if is_throttled(error) or isinstance(error, (OSError, TimeoutError)):
+        return True
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return any(name in names for name in _TRANSIENT_ERROR_NAMES)
+
+
+class RequestPolicy:
+    """Make requests with retries and, optionally, hedging.
+
+    retries is the number of times a request that failed with a transient
+    error is tried again, after sleeping for a random time of up to
+    backoff * 2**attempt (capped at max_backoff) seconds. With hedge set, a
+    duplicate is sent once a request takes longer than hedge_quantile of the
+    latencies of the last 200 requests (after hedge_min_samples of them).
+
+    Hedges are paid for from a token bucket that holds at most hedge_burst
+    tokens and gains hedge_budget of one per request, so that at most about
+    that fraction of requests is duplicated. A request that can't be hedged
+    (no token left, or too few samples yet) runs on the calling thread;
+    one that can runs on a worker so that the caller can stop waiting for
+    it, and gives its token back if it answers in time.
+    """
+
+    LATENCY_WINDOW = 200
+
+    def __init__(
+        self,
+        retries=3,
+        backoff=0.1,
+        max_backoff=10.0,
+        hedge=False,
+        hedge_quantile=0.95,
+        hedge_min_samples=20,
+        hedge_budget=0.05,
+        hedge_burst=4,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_budget = hedge_budget
+        self.hedge_burst = hedge_burst
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._hedge_tokens = float(self.hedge_burst)
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_lock", "_executor", "_latencies", "_hedge_tokens"):
+            state.pop(key)
+        for key in ("requests", "retried", "failed", "hedged", "hedge_wins"):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def call(self, request, slot=nullcontext):
+        """Return request(), retrying (and hedging) it as configured.
+
+        slot optionally returns a context manager held around every attempt
+        (e.g. a concurrency limit); the time spent waiting for it doesn't
+        count towards the latency of the request.
+        """
+        with self._lock:
+            self.requests += 1
+            self._hedge_tokens = min(
+                self.hedge_burst, self._hedge_tokens + self.hedge_budget
+            )
+        attempt = 0
+        while True:
+            try:
+                return self._call_once(request, slot)
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e):
+                    if not isinstance(e, _PERMANENT_ERRORS):
+                        self._count("failed")
+                    raise
+            delay = min(self.max_backoff, self.backoff * 2**attempt)
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+            self._count("retried")
+
+    def _attempt(self, request, slot, started=None):
+        try:
+            with slot():
+                # the hedge timer starts once the request is actually made
+                if started is not None:
+                    started.set()
+                start = time.monotonic()
+                result = request()
+                latency = time.monotonic() - start
+        finally:
+            if started is not None:
+                started.set()
+        with self._lock:
+            self._latencies.append(latency)
+        return result
+
+    def hedge_after(self):
+        """Seconds after which to send a duplicate request, or None."""
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(self.hedge_quantile * (len(latencies) - 1))]
+
+    def _reserve_hedge(self):
+        with self._lock:
+            if self._hedge_tokens < 1:
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+    def _refund_hedge(self):
+        with self._lock:
+            self._hedge_tokens = min(self.hedge_burst, self._hedge_tokens + 1)
+
+    def _call_once(self, request, slot):
+        delay = self.hedge_after() if self.hedge else None
+        if delay is None or not self._reserve_hedge():
+            return self._attempt(request, slot)
+        with self._lock:
+            if self._executor is None:
+                # reserved tokens bound the first attempts and their hedges
+                self._executor = ThreadPoolExecutor(
+                    2 * int(self.hedge_burst), thread_name_prefix="hedged-request"
+                )
+        started = threading.Event()
+        first = self._executor.submit(self._attempt, request, slot, started)
+        started.wait()
+        done, _ = wait([first], timeout=delay)
+        if done:
+            self._refund_hedge()
+            return first.result()
+        self._count("hedged")
+        second = self._executor.submit(self._attempt, request, slot)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def info(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retried": self.retried,
+                "failed": self.failed,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+            }
@@ -31,3 +31,29 @@ def calc_cycle_validity_lead_times(cycle_time=None, validity_time=None, lead_tim
 
 def remove_trailing_z(dt_str):
     return dt_str[:-1] if dt_str.endswith("Z") else dt_str
+
+
+class PooledHTTPClient:
+    """Create aiohttp sessions with a bounded, keep-alive connection pool.
+
+    Passed to fsspec's HTTP filesystem as ``get_client``. A class rather than a
+    closure so that it can be pickled and gives fsspec a stable cache token.
+    """
+
+    def __init__(self, pool_size=None, keep_alive=None):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+
+    def __repr__(self):
+        return f"PooledHTTPClient(pool_size={self.pool_size}, keep_alive={self.keep_alive})"
+
+    async def __call__(self, **kwargs):
+        import aiohttp
+
+        connector_kwargs = {}
+        if self.pool_size is not None:
+            connector_kwargs["limit"] = self.pool_size
+        if self.keep_alive is not None:
+            connector_kwargs["keepalive_timeout"] = self.keep_alive
+        connector = aiohttp.TCPConnector(**connector_kwargs)
+        return aiohttp.ClientSession(connector=connector, **kwargs)
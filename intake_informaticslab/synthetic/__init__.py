@@ -0,0 +1,4 @@
+"""Synthetic stand-ins for the Met Office archives, for offline benchmarks."""
+
+from .archive import CATALOG_DIR, catalog_entries, make_dataset, write_archive
+from .server import SyntheticServer
@@ -0,0 +1,205 @@
+"""Synthetic archives laid out like the Met Office data the catalogs describe.
+
+The datasets are made from the entries of the bundled catalogs (with the
+storage swapped for a local one and, optionally, a coarser grid) and the
+files are written to the URLs those datasets will read, so the archive
+always matches the layout the datasources expect.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import yaml
+
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cats")
+CATALOG_FILES = ("mogreps_cat.yaml", "air_quality_cat.yaml", "ukv_timeseries_cat.yaml")
+
+# dims of the grid, which grid_reduction makes coarser
+GRID_DIMS = (
+    "projection_y_coordinate",
+    "projection_x_coordinate",
+    "grid_latitude",
+    "grid_longitude",
+    "latitude",
+    "longitude",
+)
+
+
+def _load_catalog(path):
+    with open(path) as f:
+        return yaml.safe_load(f)["sources"]
+
+
+def catalog_entries():
+    """Return the (driver, args) of every dataset of the bundled catalogs.
+
+    Entries of merged sources are named after both, e.g.
+    'mogreps_uk/single_level'.
+    """
+    entries = {}
+    for catalog_file in CATALOG_FILES:
+        for name, source in _load_catalog(
+            os.path.join(CATALOG_DIR, catalog_file)
+        ).items():
+            if source["driver"].endswith("MergedMetOfficeDataSource"):
+                for path in source["args"]["path"]:
+                    path = path.replace("{{ CATALOG_DIR }}", CATALOG_DIR)
+                    for sub_name, sub_source in _load_catalog(path).items():
+                        entries[f"{name}/{sub_name}"] = (
+                            sub_source["driver"],
+                            sub_source["args"],
+                        )
+            else:
+                entries[name] = (source["driver"], source["args"])
+    return entries
+
+
+def _reduce_grid(static_coords, grid_reduction):
+    reduced = {}
+    for name, defn in static_coords.items():
+        data = defn["data"]
+        if name in GRID_DIMS and isinstance(data, dict) and grid_reduction > 1:
+            data = dict(data, num=max(1, data["num"] // grid_reduction))
+        reduced[name] = dict(defn, data=data)
+    return reduced
+
+
+def make_dataset(
+    name,
+    start,
+    end,
+    data_protocol="file",
+    url_prefix=None,
+    grid_reduction=1,
+    forecast_extent=None,
+    diagnostics=None,
+    **dataset_options,
+):
+    """Return the dataset of catalog entry name, reading from local storage.
+
+    start and end are the first and last cycle (or time) to include.
+    grid_reduction divides the number of points along each grid dim,
+    forecast_extent optionally shortens forecasts (e.g. '3H') and
+    diagnostics optionally selects some of the entry's diagnostics. Other
+    keyword arguments are passed to the dataset.
+    """
+    from ..datasources.aq_datasource import AQDataset, TimeSeriesDataset
+    from ..datasources.dataset import MODataset
+
+    driver, args = catalog_entries()[name]
+    storage_options = {"data_protocol": data_protocol, "url_prefix": url_prefix}
+    common = dict(
+        model=args["model"],
+        dims=args["dimensions"],
+        diagnostics=list(diagnostics or args["diagnostics"]),
+        static_coords=_reduce_grid(args["static_coords"], grid_reduction),
+        **dataset_options,
+    )
+    if driver.endswith("MetOfficeDataSource"):
+        return MODataset(
+            start_cycle=start,
+            end_cycle=end,
+            cycle_freq=args["cycle_frequency"],
+            start_lead_time="0H",
+            end_lead_time=forecast_extent or args["forecast_extent"],
+            lead_time_freq="1H",
+            **common,
+            **storage_options,
+        )
+    single_time = dict(
+        start_datetime=start,
+        end_datetime=end,
+        timestep=args["timestep"],
+        storage_options=storage_options,
+        **common,
+    )
+    if driver.endswith("MetOfficeAQDataSource"):
+        return AQDataset(aggregation=args.get("aggregation"), **single_time)
+    return TimeSeriesDataset(**single_time)
+
+
+def _field(rng, shape, dtype):
+    # smooth fields with noise compress (and decompress) like real ones
+    return np.cumsum(rng.normal(size=shape), axis=-1).astype(dtype)
+
+
+def _forecast_files(dataset):
+    """Yield the (diagnostic, url, time coords) of every file of a forecast."""
+    cycles = dataset.dynamic_coords["forecast_reference_time"].values
+    leads = dataset.dynamic_coords["forecast_period"].values
+    for diagnostic in dataset.diagnostics:
+        for cycle in cycles:
+            for lead in leads:
+                cycle_time, lead_time = pd.Timestamp(cycle), pd.Timedelta(lead)
+                url = dataset._get_url(
+                    diagnostic, cycle_time=cycle_time, lead_time=lead_time
+                )
+                coords = {
+                    "forecast_reference_time": cycle_time,
+                    "forecast_period": lead_time,
+                    "time": cycle_time + lead_time,
+                }
+                yield diagnostic, url, coords
+
+
+def _time_series_files(dataset):
+    """Yield the (diagnostic, url, time coords) of every file of a time series."""
+    times = dataset._build_times()
+    per_file = dataset._file_chunks["time"]
+    for diagnostic in dataset.diagnostics:
+        for time in times[::per_file]:
+            url = dataset._get_blob_url(diagnostic=diagnostic, time=time)
+            # files always hold a whole day, even past the end of the dataset
+            file_times = pd.date_range(time, periods=per_file, freq=dataset.timestep)
+            yield diagnostic, url, {"time": file_times}
+
+
+def write_archive(dataset, missing=0.0, seed=0, dtype="float32", zlib=True):
+    """Write every file of dataset to its storage, as the datasources expect.
+
+    missing is the fraction of files (chosen at random) left out, to make
+    gaps. Returns the number of files written and left out and their size.
+    """
+    import xarray as xr
+
+    from ..datasources.aq_datasource import SingleTimeDataset
+
+    rng = np.random.default_rng(seed)
+    if isinstance(dataset, SingleTimeDataset):
+        files = _time_series_files(dataset)
+        time_dims = ["time"]
+    else:
+        files = _forecast_files(dataset)
+        time_dims = []
+    static_coords = dataset.static_coords
+    static_dims = [dim for dim in dataset.dims if dim in static_coords]
+    file_dims = time_dims + static_dims
+
+    fs = dataset.fs
+    local = dataset.data_protocol == "file"
+    summary = {"files": 0, "missing": 0, "bytes": 0}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for diagnostic, url, time_coords in files:
+            if missing and rng.random() < missing:
+                summary["missing"] += 1
+                continue
+            coords = dict(time_coords)
+            coords.update((dim, static_coords[dim]) for dim in static_dims)
+            shape = tuple(len(coords[dim]) for dim in file_dims)
+            ds = xr.Dataset(
+                {diagnostic: (file_dims, _field(rng, shape, dtype))}, coords=coords
+            )
+            path = dataset._url_to_path(url)
+            target = path if local else os.path.join(tmp_dir, "file.nc")
+            if local:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            ds.to_netcdf(
+                target, engine="h5netcdf", encoding={diagnostic: {"zlib": zlib}}
+            )
+            if not local:
+                fs.put_file(target, path)
+            summary["files"] += 1
+            summary["bytes"] += os.path.getsize(target)
+    return summary
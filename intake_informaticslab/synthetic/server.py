@@ -0,0 +1,185 @@
+"""A local HTTP server for synthetic archives that behaves like a slow store.
+
+It serves the files under a directory (with ranged GETs, HEAD requests and
+HTML directory listings, which is what fsspec's HTTP filesystem needs) and
+can add latency to every response, limit the bandwidth of each one and
+answer a fraction of requests with errors such as 404 or 503.
+"""
+
+import os
+import random
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+BLOCK_SIZE = 2**16
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def _respond(self, body):
+        server = self.server.owner
+        status = server._before_response()
+        if status is not None:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        relative = unquote(urlsplit(self.path).path).lstrip("/")
+        path = os.path.realpath(os.path.join(server.root, relative))
+        if not (path == server.root or path.startswith(server.root + os.sep)):
+            self._send_status(403)
+        elif os.path.isdir(path):
+            self._send_listing(path, relative, body)
+        elif os.path.isfile(path):
+            self._send_file(path, body)
+        else:
+            self._send_status(404)
+
+    def _send_status(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send_listing(self, path, relative, body):
+        prefix = "/" + quote(relative.rstrip("/")) if relative.strip("/") else ""
+        links = [
+            f'<a href="{prefix}/{quote(name)}">{escape(name)}</a>'
+            for name in sorted(os.listdir(path))
+        ]
+        content = ("<html><body>" + "<br>".join(links) + "</body></html>").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+    def _send_file(self, path, body):
+        size = os.path.getsize(path)
+        start, end = 0, size
+        ranged = self.headers.get("Range", "").startswith("bytes=")
+        if ranged:
+            first, _, last = self.headers["Range"][len("bytes=") :].partition("-")
+            if first:
+                start, end = int(first), min(size, int(last) + 1) if last else size
+            else:
+                start = max(0, size - int(last))
+        self.send_response(206 if ranged else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        if ranged:
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+        self.end_headers()
+        if not body:
+            return
+        bandwidth = self.server.owner.bandwidth
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = f.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining -= len(block)
+                if bandwidth:
+                    time.sleep(len(block) / bandwidth)
+        self.server.owner._count("bytes", end - start)
+
+
+class SyntheticServer:
+    """Serve the files under root over HTTP on a background thread.
+
+    latency is the number of seconds every response is delayed by,
+    bandwidth (bytes per second) limits the speed of each response and
+    error_rates maps HTTP statuses to the fraction of requests answered
+    with them, e.g. {503: 0.05, 404: 0.01}. Datasets read from it with
+    data_protocol 'http' and url_prefix server.url_prefix. Use it as a
+    context manager, or call start and stop.
+    """
+
+    def __init__(
+        self,
+        root,
+        latency=0.0,
+        bandwidth=None,
+        error_rates=None,
+        seed=None,
+        host="127.0.0.1",
+        port=0,
+    ):
+        self.root = os.path.realpath(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rates = dict(error_rates or {})
+        self.host = host
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+
+    @property
+    def url_prefix(self):
+        return f"{self.host}:{self.port}"
+
+    @property
+    def url(self):
+        return f"http://{self.url_prefix}"
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _before_response(self):
+        """Count a request and wait for latency, returning a status to fail with."""
+        with self._lock:
+            self.stats["requests"] += 1
+            draw = self._random.random()
+        if self.latency:
+            time.sleep(self.latency)
+        for status, rate in self.error_rates.items():
+            if draw < rate:
+                self._count("errors")
+                return status
+            draw -= rate
+        return None
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="synthetic-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
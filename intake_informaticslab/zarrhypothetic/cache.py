@@ -0,0 +1,318 @@
+import json
+import os
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+
+import fasteners
+
+
+class LRUChunkCache:
+    """Thread-safe in-memory cache of encoded chunks with a byte budget.
+
+    Keys are store keys (``var/chunk-index``), values are the bytes (or any
+    buffer-protocol object) returned by the store. The least recently used
+    entries are evicted once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._init_state()
+
+    def _init_state(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        # only ship the configuration, each process keeps its own entries
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @staticmethod
+    def _nbytes(value):
+        return memoryview(value).nbytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._nbytes(self._entries.pop(key))
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= self._nbytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class DiskChunkCache(MutableMapping):
+    """Size-limited directory of chunks, safe to share between processes.
+
+    Writes go to a temporary file that is renamed into place, so readers
+    never see partial chunks. When the directory grows beyond max_bytes the
+    writing process takes an inter-process lock and evicts entries until
+    the cache is back under low_water (a fraction of max_bytes), choosing
+    them by policy: "lru" (least recently used, from file modification
+    times which are bumped on every read) or "lfu" (least frequently used,
+    from hit counts that every process merges into a shared file).
+    """
+
+    POLICIES = ("lru", "lfu")
+    LOCK_FILE = ".lock"
+    COUNTS_FILE = ".counts.json"
+    TMP_SUFFIX = ".tmp"
+    # re-scan the directory after this many writes to account for the
+    # writes of other processes
+    RESCAN_INTERVAL = 100
+
+    def __init__(self, root, max_bytes, policy="lru", low_water=0.9):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}, got {policy}")
+        self.root = os.path.abspath(root)
+        self.max_bytes = int(max_bytes)
+        self.policy = policy
+        self.low_water = low_water
+        os.makedirs(self.root, exist_ok=True)
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = fasteners.InterProcessLock(os.path.join(self.root, self.LOCK_FILE))
+        self._thread_lock = threading.Lock()
+        self._hit_counts = Counter()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # the size of the entries, found by a scan on the first write (or
+        # eviction) as walking a large cache is slow
+        self._current_bytes = None
+
+    def __getstate__(self):
+        return {
+            "root": self.root,
+            "max_bytes": self.max_bytes,
+            "policy": self.policy,
+            "low_water": self.low_water,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def _path(self, key):
+        parts = key.split("/")
+        if any(part in ("", ".", "..") for part in parts):
+            raise KeyError(key)
+        return os.path.join(self.root, *parts)
+
+    def _is_entry(self, name):
+        return name not in (self.LOCK_FILE, self.COUNTS_FILE) and not name.endswith(
+            self.TMP_SUFFIX
+        )
+
+    def _scan(self):
+        """Yield (key, size, mtime) for every entry in the cache."""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filter(self._is_entry, filenames):
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                yield key, stat.st_size, stat.st_mtime
+
+    def __getitem__(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            with self._thread_lock:
+                self.misses += 1
+            raise KeyError(key)
+        with self._thread_lock:
+            self.hits += 1
+            self._hit_counts[key] += 1
+        if self.policy == "lru":
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        return value
+
+    def __setitem__(self, key, value):
+        path = self._path(key)
+        size = memoryview(value).nbytes
+        if size > self.max_bytes:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # an overwritten entry no longer counts towards the size
+        old_size = self._size(path)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=self.TMP_SUFFIX
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._thread_lock:
+            known = self._current_bytes is not None
+            if known:
+                self._current_bytes += size - old_size
+            self._writes += 1
+            rescan = not known or self._writes % self.RESCAN_INTERVAL == 0
+            over_budget = known and self._current_bytes > self.max_bytes
+        if over_budget or rescan:
+            self._evict()
+
+    def __delitem__(self, key):
+        path = self._path(key)
+        size = self._size(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            raise KeyError(key)
+        with self._thread_lock:
+            if self._current_bytes is not None:
+                self._current_bytes -= size
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.stat(path).st_size
+        except (FileNotFoundError, NotADirectoryError):
+            return 0
+
+    def __iter__(self):
+        return (key for key, _, _ in self._scan())
+
+    def __len__(self):
+        return sum(1 for _ in self._scan())
+
+    def _load_counts(self):
+        try:
+            with open(os.path.join(self.root, self.COUNTS_FILE)) as f:
+                return Counter(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return Counter()
+
+    def _save_counts(self, counts):
+        path = os.path.join(self.root, self.COUNTS_FILE)
+        tmp_path = f"{path}.{os.getpid()}{self.TMP_SUFFIX}"
+        with open(tmp_path, "w") as f:
+            json.dump(counts, f)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        with self._lock:
+            entries = list(self._scan())
+            total = sum(size for _, size, _ in entries)
+            counts = None
+            if self.policy == "lfu":
+                with self._thread_lock:
+                    local_counts, self._hit_counts = self._hit_counts, Counter()
+                counts = self._load_counts() + local_counts
+            evictions = 0
+            if total > self.max_bytes:
+                if counts is None:
+                    entries.sort(key=lambda entry: entry[2])
+                else:
+                    entries.sort(key=lambda entry: (counts[entry[0]], entry[2]))
+                target = self.max_bytes * self.low_water
+                for key, size, _ in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(self._path(key))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    evictions += 1
+                    if counts is not None:
+                        counts.pop(key, None)
+            if counts is not None:
+                self._save_counts(dict(counts))
+        with self._thread_lock:
+            self._current_bytes = total
+            self.evictions += evictions
+
+    def clear(self):
+        with self._lock:
+            for key in list(self):
+                try:
+                    del self[key]
+                except KeyError:
+                    pass
+        with self._thread_lock:
+            self._current_bytes = 0
+
+    @property
+    def current_bytes(self):
+        """The size of the entries, scanning the directory if not yet known."""
+        if self._current_bytes is None:
+            total = sum(size for _, size, _ in self._scan())
+            with self._thread_lock:
+                if self._current_bytes is None:
+                    self._current_bytes = total
+        return self._current_bytes
+
+    def info(self):
+        current_bytes = self.current_bytes
+        with self._thread_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "current_bytes": current_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,249 @@
+"""Instrumentation of chunk loads.
+
+Stores with hooks create a ChunkEvent for every data chunk asked for and
+pass it to each hook once the chunk has been returned (or found missing, or
+failed). While a chunk is being loaded its event is the thread's current
+event, so the loader function can fill in what only it knows (the URL, the
+bytes transferred, the time spent fetching and decoding) with annotate and
+timed, which do nothing when there is no current event. Timed blocks are
+also kept as spans, from which tracing draws timelines.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+OK = "ok"
+MISSING = "missing"
+ERROR = "error"
+
+_CURRENT = threading.local()
+
+
+class ChunkEvent:
+    """What happened when a data chunk was asked for.
+
+    cache is 'hit' (memory cache), 'prefetched' (loaded in the background
+    beforehand), 'miss' (loaded when asked for), 'shared' (waited for a load
+    of the same chunk already in flight) or 'prefetch' (a background load).
+    phases maps phase names ('queued', 'fetch', 'decode', 'copy',
+    'encode') to seconds and duration is the time from request to answer.
+    spans lists the (phase, start, end) perf_counter times of each phase.
+    """
+
+    __slots__ = (
+        "item",
+        "url",
+        "nbytes",
+        "cache",
+        "outcome",
+        "error",
+        "phases",
+        "spans",
+        "start",
+        "duration",
+        "thread_id",
+        "pid",
+    )
+
+    def __init__(self, item, cache=None):
+        self.item = item
+        self.url = None
+        self.nbytes = None
+        self.cache = cache
+        self.outcome = None
+        self.error = None
+        self.phases = {}
+        self.spans = []
+        self.start = time.perf_counter()
+        self.duration = None
+        self.thread_id = threading.get_ident()
+        self.pid = os.getpid()
+
+    def add_span(self, phase, start, end):
+        self.phases[phase] = self.phases.get(phase, 0.0) + end - start
+        self.spans.append((phase, start, end))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"ChunkEvent({self.item!r}, {self.outcome}, cache={self.cache})"
+
+
+def current_event():
+    """Return the event of the chunk being loaded by this thread, if any."""
+    return getattr(_CURRENT, "event", None)
+
+
+def annotate(**fields):
+    """Set fields (e.g. url, nbytes) of the current event, if there is one."""
+    event = current_event()
+    if event is not None:
+        for name, value in fields.items():
+            setattr(event, name, value)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to phase of the current event."""
+    event = current_event()
+    if event is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        event.add_span(phase, start, time.perf_counter())
+
+
+def mark_queued(since):
+    """Record that the next chunk this thread loads was asked for at since."""
+    _CURRENT.queued = since
+
+
+@contextmanager
+def record_chunk(item, hooks, cache=None):
+    """Make an event for loading item the current one, then pass it to hooks.
+
+    A KeyError (an absent chunk) is recorded as MISSING and other exceptions
+    as ERROR, and re-raised. Yields the event so that the caller can set its
+    cache field.
+    """
+    event = ChunkEvent(item, cache)
+    queued = getattr(_CURRENT, "queued", None)
+    if queued is not None:
+        _CURRENT.queued = None
+        event.add_span("queued", queued, event.start)
+    previous = current_event()
+    _CURRENT.event = event
+    try:
+        yield event
+    except KeyError:
+        event.outcome = MISSING
+        raise
+    except Exception as e:
+        event.outcome = ERROR
+        event.error = repr(e)
+        raise
+    else:
+        event.outcome = OK
+    finally:
+        _CURRENT.event = previous
+        event.duration = time.perf_counter() - event.start
+        for hook in hooks:
+            hook(event)
+
+
+class Histogram:
+    """Counts of values in buckets between edges (which must be sorted).
+
+    Values above the last edge are counted in a final overflow bucket.
+    Quantiles are estimated as the upper edge of the bucket they fall in.
+    """
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def exponential(cls, start, factor, num):
+        return cls(start * factor**i for i in range(num))
+
+    def add(self, value):
+        self.counts[bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return self.edges[i] if i < len(self.edges) else self.max
+        return self.max
+
+    def info(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class ChunkRecorder:
+    """A hook that aggregates chunk events into histograms and counts.
+
+    Latencies (the duration and every phase) are kept in buckets growing by
+    a factor of two from 10us, sizes in buckets growing by a factor of two
+    from 1kB. With keep_events, the last max_events events are kept too.
+    """
+
+    def __init__(self, keep_events=False, max_events=100_000):
+        self.keep_events = keep_events
+        self.max_events = max_events
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self.events = []
+        self.outcomes = {}
+        self.caches = {}
+        self.latencies = {}
+        self.sizes = Histogram.exponential(2**10, 2, 24)
+
+    def __getstate__(self):
+        return {"keep_events": self.keep_events, "max_events": self.max_events}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def _latency(self, name):
+        if name not in self.latencies:
+            self.latencies[name] = Histogram.exponential(1e-5, 2, 25)
+        return self.latencies[name]
+
+    def __call__(self, event):
+        with self._lock:
+            self.outcomes[event.outcome] = self.outcomes.get(event.outcome, 0) + 1
+            self.caches[event.cache] = self.caches.get(event.cache, 0) + 1
+            self._latency("duration").add(event.duration)
+            for phase, seconds in event.phases.items():
+                self._latency(phase).add(seconds)
+            if event.nbytes is not None:
+                self.sizes.add(event.nbytes)
+            if self.keep_events:
+                self.events.append(event)
+                del self.events[: -self.max_events]
+
+    def reset(self):
+        with self._lock:
+            self._init_state()
+
+    def summary(self):
+        with self._lock:
+            return {
+                "chunks": sum(self.outcomes.values()),
+                "outcomes": dict(self.outcomes),
+                "cache": dict(self.caches),
+                "bytes": self.sizes.info(),
+                "latency": {name: hist.info() for name, hist in self.latencies.items()},
+            }
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChunkPrefetcher:
+    """Load chunks in the background before they are asked for.
+
+    load is a function from a store key to its value. Scheduled keys are
+    loaded on a small thread pool and held until taken, within max_bytes
+    (pending loads are counted at the size of the last loaded chunk). When
+    the budget is full the oldest unclaimed results are dropped to make room.
+    """
+
+    def __init__(self, load, max_bytes, max_workers=2):
+        self.load = load
+        self.max_bytes = int(max_bytes)
+        self.max_workers = max_workers
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = OrderedDict()
+        self._sizes = {}
+        self._estimate = 0
+        self.prefetched = 0
+        self.used = 0
+        self.dropped = 0
+
+    def __getstate__(self):
+        return {
+            "load": self.load,
+            "max_bytes": self.max_bytes,
+            "max_workers": self.max_workers,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def _reserved_bytes(self):
+        return sum(self._sizes.get(key, self._estimate) for key in self._futures.keys())
+
+    def _load(self, key):
+        try:
+            value = self.load(key)
+        except KeyError:
+            # absent chunk, the KeyError is raised again when it is taken
+            with self._lock:
+                if key in self._futures:
+                    self._sizes[key] = 0
+            raise
+        size = memoryview(value).nbytes if value is not None else 0
+        with self._lock:
+            self._estimate = size
+            if key in self._futures:
+                self._sizes[key] = size
+        return value
+
+    def take(self, key):
+        """Return the future of a prefetched key, or None if it wasn't scheduled."""
+        with self._lock:
+            future = self._futures.pop(key, None)
+            self._sizes.pop(key, None)
+            if future is not None:
+                self.used += 1
+        return future
+
+    def schedule(self, keys):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="chunk-prefetch"
+                )
+            for key in keys:
+                if key in self._futures:
+                    continue
+                # make room by dropping the oldest finished, unclaimed results
+                while self._futures and (
+                    self._reserved_bytes() + self._estimate > self.max_bytes
+                ):
+                    oldest = next(iter(self._futures))
+                    if not self._futures[oldest].done():
+                        break
+                    del self._futures[oldest]
+                    self._sizes.pop(oldest, None)
+                    self.dropped += 1
+                if self._reserved_bytes() + self._estimate > self.max_bytes:
+                    return
+                self._futures[key] = self._executor.submit(self._load, key)
+                self.prefetched += 1
+
+    def info(self):
+        with self._lock:
+            return {
+                "prefetched": self.prefetched,
+                "used": self.used,
+                "dropped": self.dropped,
+                "pending": len(self._futures),
+                "reserved_bytes": self._reserved_bytes(),
+                "max_bytes": self.max_bytes,
+            }
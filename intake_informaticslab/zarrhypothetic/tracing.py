@@ -0,0 +1,121 @@
+"""Timelines of chunk loads in the Chrome trace event format.
+
+A ChromeTrace is a hook (see instrumentation) that keeps every chunk event
+and writes them as a JSON trace, which chrome://tracing or Perfetto show as
+one row per thread: a span for each chunk, with its queued, fetch, decode,
+copy and encode phases nested underneath. Threads that spend their time
+fetching are network-bound, long decode spans on many threads point at the
+GIL and gaps between chunks at the scheduler.
+
+Only loads made by this process are seen (e.g. the threaded dask scheduler,
+not a distributed cluster), although decoding in a DecodePool still shows
+as the decode phase of the thread waiting for it.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ChromeTrace:
+    """A hook that collects chunk events to write as a Chrome trace."""
+
+    def __init__(self):
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self.events = []
+        self.origin = time.perf_counter()
+        self.thread_names = {}
+
+    def __getstate__(self):
+        # copies (e.g. in the stores of dask workers) start an empty trace, as
+        # perf_counter times can't be compared across processes
+        return {}
+
+    def __setstate__(self, state):
+        self._init_state()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+            self.thread_names.setdefault(
+                (event.pid, event.thread_id), threading.current_thread().name
+            )
+
+    def _micros(self, seconds):
+        return round((seconds - self.origin) * 1e6, 3)
+
+    def _span(self, name, category, start, end, event, args=None):
+        return {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._micros(start),
+            "dur": round((end - start) * 1e6, 3),
+            "pid": event.pid,
+            "tid": event.thread_id,
+            "args": args or {},
+        }
+
+    def trace_events(self):
+        """Return the list of trace events (complete spans and thread names)."""
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        trace = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for (pid, tid), name in thread_names.items()
+        ]
+        for event in events:
+            args = {
+                "url": event.url,
+                "nbytes": event.nbytes,
+                "cache": event.cache,
+                "outcome": event.outcome,
+            }
+            if event.error is not None:
+                args["error"] = event.error
+            end = event.start + event.duration
+            trace.append(self._span(event.item, "chunk", event.start, end, event, args))
+            for phase, start, end in event.spans:
+                trace.append(self._span(phase, phase, start, end, event))
+        return trace
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "traceEvents": self.trace_events(),
+                    "displayTimeUnit": "ms",
+                    "otherData": {"pid": os.getpid()},
+                },
+                f,
+            )
+
+
+@contextmanager
+def chrome_trace(path, *hook_lists):
+    """Trace the chunk loads of stores (given by their hooks lists) to path.
+
+    The trace is written when the block exits, even if it raised.
+    """
+    tracer = ChromeTrace()
+    for hooks in hook_lists:
+        hooks.append(tracer)
+    try:
+        yield tracer
+    finally:
+        for hooks in hook_lists:
+            hooks.remove(tracer)
+        if path is not None:
+            tracer.write(path)
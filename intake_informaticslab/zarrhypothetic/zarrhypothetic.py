@@ -1,13 +1,21 @@
 import json
+import threading
+import time
 from collections import namedtuple
 from collections.abc import MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 from functools import partial
 from itertools import product
 
+import numcodecs
 import numpy as np
 import xarray as xr
 import zarr
 
+from .instrumentation import annotate, mark_queued, record_chunk, timed
+from .prefetch import ChunkPrefetcher
+
 FlagsProxy = namedtuple("FlagsProxy", ("c_contiguous",))
 FlagsProxy.__new__.__defaults__ = (True,)
 
@@ -27,13 +35,31 @@ VariableProxy = namedtuple(
 )
 VariableProxy.__new__.__defaults__ = (ValuesProxy(), DataProxy(), {})
 
+# netCDF's default fill values for data that isn't float (as in
+# netCDF4.default_fillvals), so that absent chunks read as missing rather
+# than as a value, like 0, that real data may hold
+_NC_FILL_VALUES = {
+    "i1": -127,
+    "u1": 255,
+    "i2": -32767,
+    "u2": 65535,
+    "i4": -2147483647,
+    "u4": 4294967295,
+    "i8": -9223372036854775806,
+    "u8": 18446744073709551614,
+}
+
+
+# subclassing BaseStore (zarr >= 2.11) rather than wrapping the store in a
+# KVStore lets zarr call getitems on it directly
+StoreBase = getattr(zarr.storage, "BaseStore", MutableMapping)
 
-class HypotheticZarrStore(MutableMapping):
+
+class HypotheticZarrStore(StoreBase):
     # For now define only the MutableMapping methods which are
     # overridden for zarr.storage.DirectoryStore
     # Could also implement:
     #     # mixins from base class
-    #     def __contains__(self, item):
     #     def items(self):
     #     def values(self):
     #     def get(self, key, default=None):
@@ -53,6 +79,8 @@ class HypotheticZarrStore(MutableMapping):
         zarr.storage.attrs_key,
         METADATA_KEY,
     ]
+    _writeable = False
+    _erasable = False
 
     def __init__(
         self,
@@ -63,18 +91,45 @@ class HypotheticZarrStore(MutableMapping):
         loader_function,
         attrs=None,
         dtypes=None,
+        cache=None,
+        compressor=None,
+        filters=None,
+        max_concurrent_loads=8,
+        prefetch_dims=None,
+        prefetch_depth=0,
+        prefetch_max_bytes=2**29,
+        hooks=None,
     ):
         # dims is a list/tuple of strs
         # coord vars is a dictionary of variables
         # datavars is a list of strs (assume all have the same dims -> same shape)
         # chunks is a dict describing chunks in a file (if missing, assume value is 1)
+        #   chunks need not divide the dim length, edge chunks are padded with
+        #   the fill_value (NaN for float data)
         # loader_function goes from coord values to data (via file)
-        #   func assumed to return np array
+        #   func assumed to return np array, or None if there is no data for
+        #   the chunk (e.g. a missing file) which is then absent from the store
+        #   and read by zarr as fill_value
+        #   it is also passed the index slice of every dim covered by the chunk
+        #   (under the "selection" key) so it can read a part of a file
 
         # optional:
         # attrs is a dict of global attrs for whole dataset
         # dtypes is a dict containing strings which specify the numpy dtype
         # of the data in the array - if not specified, float32 assumed
+        # cache is a chunk cache (e.g. LRUChunkCache) consulted before calling
+        # the loader_function
+        # compressor and filters are numcodecs codecs (or their config dicts)
+        # used to encode data chunks, e.g. {"id": "blosc", "cname": "zstd"}
+        # and [{"id": "bitround", "keepbits": 10}] - they are advertised in
+        # .zarray so clones and caches of the store hold compressed chunks
+        # max_concurrent_loads bounds the threads used by getitems to call the
+        # loader_function for many chunks at once
+        # prefetch_depth > 0 starts loading the next prefetch_depth chunks along
+        # each of prefetch_dims in the background whenever a chunk is read,
+        # holding at most prefetch_max_bytes of results until they are read
+        # hooks is a list of callables passed a ChunkEvent (see
+        # instrumentation) for every data chunk asked for or prefetched
 
         # guard clause
         assert all(map(lambda dim: dim in coord_vars, dims))
@@ -82,7 +137,23 @@ class HypotheticZarrStore(MutableMapping):
         self.attrs = attrs if attrs else {}
         self.chunks = chunks
         self.loader_function = loader_function
+        self.cache = cache
+        self.compressor = self._get_codec(compressor)
+        self.filters = [self._get_codec(codec) for codec in filters or []]
+        self.max_concurrent_loads = max_concurrent_loads
+        self.prefetch_dims = tuple(prefetch_dims or ())
+        self.prefetch_depth = prefetch_depth
+        self.hooks = hooks if hooks is not None else []
+        self.prefetcher = (
+            ChunkPrefetcher(self._prefetch_item, prefetch_max_bytes)
+            if self.prefetch_depth and self.prefetch_dims
+            else None
+        )
 
+        # plain numpy lookup tables of the coord values, computed once
+        self._coord_values = {
+            name: np.asarray(coord.values) for name, coord in coord_vars.items()
+        }
         # converting coord (data) arrays to dask arrays
         # to have access to number of chunks (put whole array in one chunk)
         self.coord_vars = {
@@ -95,6 +166,24 @@ class HypotheticZarrStore(MutableMapping):
             name: self._create_var_proxy(dtypes.get(name, "float32"))
             for name in data_vars
         }
+        self._metadata_cache = {}
+        self._init_pending()
+
+    def _init_pending(self):
+        # futures of the data chunks being loaded (by getitems, dask threads or
+        # the prefetcher), so that a chunk is only loaded once at a time
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_pending", "_pending_lock"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_pending()
 
     @property
     def vars(self):
@@ -121,55 +210,106 @@ class HypotheticZarrStore(MutableMapping):
             attrs=attrs,
         )
 
+    @staticmethod
+    def _get_codec(codec):
+        if codec is None or isinstance(codec, numcodecs.abc.Codec):
+            return codec
+        return numcodecs.get_codec(dict(codec))
+
+    def _encode(self, data):
+        for codec in self.filters:
+            data = codec.encode(data)
+        if self.compressor is not None:
+            data = self.compressor.encode(data)
+        return data
+
     @staticmethod
     def _chunksize(chunks, dims):
         return tuple(chunks.get(dim, 1) for dim in dims)
 
     @staticmethod
     def _num_chunks(var):
-        return tuple(s // c for s, c in zip(var.shape, var.data.chunksize))
+        return tuple(-(-s // c) for s, c in zip(var.shape, var.data.chunksize))
 
     @staticmethod
     def _var_mem_order(var):
         return "C" if var.values.flags.c_contiguous else "F"
 
+    @staticmethod
+    def _fill_value(var):
+        # zarr fills absent chunks with this, NaN for the usual float data
+        if var.dtype.kind == "f":
+            return "NaN"
+        return _NC_FILL_VALUES.get(f"{var.dtype.kind}{var.dtype.itemsize}", 0)
+
     def _zgroup_dict(self):
-        return json.dumps({"zarr_format": 2})
+        return {"zarr_format": 2}
 
     def _zattrs_dict(self, variable=None):
         if variable is None:
-            return json.dumps(self.attrs)
+            return self.attrs
         else:
-            return json.dumps(
-                dict({"_ARRAY_DIMENSIONS": variable.dims}, **variable.attrs)
-            )
+            return dict({"_ARRAY_DIMENSIONS": variable.dims}, **variable.attrs)
 
     def _zarray_dict(self, variable):
-        return json.dumps(
-            {
-                "chunks": variable.data.chunksize,
-                "compressor": None,
-                "dtype": variable.dtype.str,
-                "fill_value": None,
-                "filters": None,
-                "order": self._var_mem_order(variable),
-                "shape": variable.shape,
-                "zarr_format": 2,
-            }
-        )
+        # only data variables are encoded, coords are kept as they are
+        is_data_var = isinstance(variable, VariableProxy)
+        compressor = self.compressor if is_data_var else None
+        filters = self.filters if is_data_var else []
+        return {
+            "chunks": variable.data.chunksize,
+            "compressor": compressor.get_config() if compressor else None,
+            "dtype": variable.dtype.str,
+            "fill_value": self._fill_value(variable) if is_data_var else None,
+            "filters": [codec.get_config() for codec in filters] or None,
+            "order": self._var_mem_order(variable),
+            "shape": variable.shape,
+            "zarr_format": 2,
+        }
 
     def _zmetadata_dict(self):
-        # if called from __getitem__, recursive (depth=2) and converts back and forth
-        # between strings and dicts using json lib - should not be too slow though
-        metadata = {}
-        for key in filter(lambda key: key != self.METADATA_KEY, self.ROOT_KEYS):
-            metadata[key] = json.loads(self[key].decode())
-        for var in self.vars:
-            for key in self.META_KEYS:
-                key = f"{var}/{key}"
-                # convert back from bytestring to regular string
-                metadata[key] = json.loads(self[key].decode())
-        return json.dumps({"metadata": metadata, "zarr_consolidated_format": 1})
+        metadata = {
+            zarr.storage.group_meta_key: self._zgroup_dict(),
+            zarr.storage.attrs_key: self._zattrs_dict(),
+        }
+        for name, var in self.vars.items():
+            metadata[f"{name}/{zarr.storage.array_meta_key}"] = self._zarray_dict(var)
+            metadata[f"{name}/{zarr.storage.attrs_key}"] = self._zattrs_dict(var)
+        return {"metadata": metadata, "zarr_consolidated_format": 1}
+
+    def _get_metadata(self, var_name, key):
+        # metadata never changes, so each document is only encoded once
+        item = key if var_name is None else f"{var_name}/{key}"
+        try:
+            return self._metadata_cache[item]
+        except KeyError:
+            pass
+        accessor_mapping = {
+            zarr.storage.array_meta_key: self._zarray_dict,
+            zarr.storage.attrs_key: self._zattrs_dict,
+            zarr.storage.group_meta_key: self._zgroup_dict,
+            self.METADATA_KEY: self._zmetadata_dict,
+        }
+        accessor = accessor_mapping[key]
+        if var_name is not None:
+            accessor = partial(accessor, self.vars[var_name])
+        value = json.dumps(accessor()).encode()
+        self._metadata_cache[item] = value
+        return value
+
+    def _is_meta_key(self, var_name, key):
+        if var_name is None:
+            return key in self.ROOT_KEYS
+        return var_name in self.vars and key in self.META_KEYS
+
+    @staticmethod
+    def _split_key(item):
+        key = item.split("/")
+        if len(key) == 1:
+            return None, key[0]
+        elif len(key) == 2:
+            return tuple(key)
+        raise KeyError(f"Invalid key: {item}")
 
     def _get_dim_values(self, chunk_idxs, dims):
         chunksize = self._chunksize(self.chunks, dims)
@@ -177,58 +317,211 @@ class HypotheticZarrStore(MutableMapping):
         data_idxs = list(map(lambda x: x[0] * x[1], zip(chunk_idxs, chunksize)))
         values = []
         for dim, idx in zip(dims, data_idxs):
-            val = self.coord_vars[dim].values[idx]
+            val = self._coord_values[dim][idx]
             values.append(val.item())
         mapping = dict(zip(dims, values))
         return mapping
 
+    def _get_dim_slices(self, chunk_idxs, dims):
+        chunksize = self._chunksize(self.chunks, dims)
+        slices = {}
+        for dim, idx, size in zip(dims, chunk_idxs, chunksize):
+            start = idx * size
+            stop = min(start + size, len(self.coord_vars[dim]))
+            slices[dim] = slice(start, stop)
+        return slices
+
+    @classmethod
+    def _pad_to_chunk(cls, data, var, slices):
+        # data covers either a whole chunk or only the slices, which may be
+        # smaller than a chunk at the far edge of a dim - in that case pad it
+        # out as zarr expects full chunks, with the array's fill_value
+        if data.size == np.prod(var.data.chunksize):
+            return data.reshape(var.data.chunksize)
+        shape = tuple(sl.stop - sl.start for sl in slices.values())
+        data = data.reshape(shape)
+        fill_value = cls._fill_value(var)
+        if fill_value == "NaN":
+            fill_value = np.nan
+        padded = np.full(var.data.chunksize, fill_value, dtype=var.dtype)
+        padded[tuple(slice(0, n) for n in shape)] = data
+        return padded
+
     def __getitem__(self, item):
-        key = item.split("/")
-        if len(key) == 1:
-            var_name = None
-            key = key[0]
-        elif len(key) == 2:
-            var_name, key = key
-        else:
-            raise KeyError(f"Invalid key: {item}")
-        # mapping from keys to metadata returning methods
-        accessor_mapping = {
-            zarr.storage.array_meta_key: self._zarray_dict,
-            zarr.storage.attrs_key: self._zattrs_dict,
-            zarr.storage.group_meta_key: self._zgroup_dict,
-            self.METADATA_KEY: self._zmetadata_dict,
-        }
+        var_name, key = self._split_key(item)
         # getting metadata:
-        if key in accessor_mapping:
-            accessor = accessor_mapping[key]
-            if var_name is not None:
-                accessor = partial(accessor, self.vars[var_name])
-            return accessor().encode()
+        if key in self.ROOT_KEYS or key in self.META_KEYS:
+            if not self._is_meta_key(var_name, key):
+                raise KeyError(item)
+            return self._get_metadata(var_name, key)
         # getting coords (stored in object):
-        var = self.vars[var_name]
         if var_name in self.coord_vars:
-            data = var.values
+            var = self.vars[var_name]
+            values = self._coord_values[var_name]
+            return values.tobytes(order=self._var_mem_order(var))
+        # getting data (from elsewhere), through the cache if there is one
+        # a missing chunk raises KeyError, which zarr reads as fill_value
+        with self._record(item) as event:
+            try:
+                value = self.cache.get(item) if self.cache is not None else None
+                if value is None:
+                    value = self._load_prefetched(item)
+                    if self.cache is not None:
+                        self.cache.put(item, value)
+                elif event is not None:
+                    event.cache = "hit"
+            finally:
+                if self.prefetcher is not None:
+                    self._prefetch_after(var_name, key)
+        return value
+
+    def _record(self, item, cache=None):
+        # yields the ChunkEvent of item, or None if nothing is listening
+        return record_chunk(item, self.hooks, cache) if self.hooks else nullcontext()
+
+    def _load_item(self, item):
+        with self._pending_lock:
+            future = self._pending.get(item)
+            loading = future is None
+            if loading:
+                future = self._pending[item] = Future()
+        if not loading:
+            # someone else is loading it, including absent (KeyError) chunks
+            annotate(cache="shared")
+            return future.result()
+        try:
+            var_name, key = item.split("/")
+            value = self._load_chunk(var_name, key)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
         else:
-            # getting data (from elsewhere):
-            accessor = self.loader_function
-            # returning data - key are chunk indices
-            chunk_idxs = tuple(int(x) for x in key.split("."))
-            # access_values are the starting values for that chunk in all dims
-            # as well as the variable name (first part of the key)
-            access_values = self._get_dim_values(chunk_idxs, var.dims)
-            access_values["variable_name"] = var_name
-            data = accessor(access_values)
-            if not isinstance(data, np.ndarray) and data is not None:
-                raise TypeError("Loader function should return a numpy.ndarray or None")
-            if data is None:
-                data = np.full(
-                    shape=var.data.chunksize,
-                    fill_value=np.nan,
-                    dtype=var.dtype,
-                    order=self._var_mem_order(var),
-                )
+            future.set_result(value)
+            return value
+        finally:
+            with self._pending_lock:
+                del self._pending[item]
+
+    def _prefetch_item(self, item):
+        with self._record(item, cache="prefetch"):
+            return self._load_item(item)
+
+    def _load_prefetched(self, item):
+        future = self.prefetcher.take(item) if self.prefetcher is not None else None
+        if future is not None:
+            try:
+                value = future.result()
+            except KeyError:
+                annotate(cache="prefetched")
+                raise
+            except Exception:
+                # e.g. a transient error in the background, try again
+                pass
+            else:
+                annotate(cache="prefetched")
+                return value
+        annotate(cache="miss")
+        return self._load_item(item)
+
+    def _prefetch_after(self, var_name, key):
+        var = self.vars[var_name]
+        chunk_idxs = [int(x) for x in key.split(".")]
+        num_chunks = self._num_chunks(var)
+        items = []
+        for dim in self.prefetch_dims:
+            if dim not in var.dims:
+                continue
+            axis = var.dims.index(dim)
+            for step in range(1, self.prefetch_depth + 1):
+                next_idxs = list(chunk_idxs)
+                next_idxs[axis] += step
+                if next_idxs[axis] >= num_chunks[axis]:
+                    break
+                next_key = ".".join(str(x) for x in next_idxs)
+                items.append(f"{var_name}/{next_key}")
+        # not those cached or already being loaded
+        if self.cache is not None:
+            items = [item for item in items if item not in self.cache]
+        items = [item for item in items if item not in self._pending]
+        self.prefetcher.schedule(items)
+
+    def _load_chunk(self, var_name, key):
+        var = self.vars[var_name]
+        # getting data (from elsewhere):
+        accessor = self.loader_function
+        # returning data - key are chunk indices
+        chunk_idxs = tuple(int(x) for x in key.split("."))
+        # access_values are the starting values for that chunk in all dims
+        # as well as the variable name (first part of the key)
+        access_values = self._get_dim_values(chunk_idxs, var.dims)
+        access_values["variable_name"] = var_name
+        slices = self._get_dim_slices(chunk_idxs, var.dims)
+        access_values["selection"] = slices
+        data = accessor(access_values)
+        if not isinstance(data, np.ndarray) and data is not None:
+            raise TypeError("Loader function should return a numpy.ndarray or None")
+        if data is None:
+            # no file: leave the chunk out so that zarr uses fill_value
+            raise KeyError(f"{var_name}/{key}")
+        with timed("copy"):
+            data = self._pad_to_chunk(data, var, slices)
             # could potentially do some checking that shape and dtype are as expected if loaded
-        return data.tobytes(order=self._var_mem_order(var))
+            data = self._as_buffer(data, var)
+        if self.compressor is not None or self.filters:
+            with timed("encode"):
+                data = bytes(self._encode(np.frombuffer(data, dtype=var.dtype)))
+        return data
+
+    def _as_buffer(self, data, var):
+        """Return the chunk as a flat memoryview of the variable's dtype and order.
+
+        The array is only copied if its dtype or memory layout has to change,
+        or if it is a view that would keep a larger (e.g. whole file) array
+        alive.
+        """
+        order = self._var_mem_order(var)
+        data = np.asarray(data, dtype=var.dtype)
+        contiguous = (
+            data.flags.c_contiguous if order == "C" else data.flags.f_contiguous
+        )
+        if not contiguous or getattr(data.base, "nbytes", 0) > data.nbytes:
+            data = np.array(data, order=order)
+        # as unsigned bytes, which any dtype can be viewed as
+        return memoryview(data.ravel(order=order).view("u1"))
+
+    def _is_data_key(self, item):
+        var_name, _, key = item.rpartition("/")
+        return var_name in self.data_vars and not key.startswith(".")
+
+    def _get_or_none(self, item, queued=None):
+        if queued is not None:
+            mark_queued(queued)
+        try:
+            return self[item]
+        except KeyError:
+            return None
+
+    def getitems(self, keys, *, contexts=None):
+        """Return a dict of the values of keys, leaving out missing keys.
+
+        Data chunks are loaded concurrently on a bounded thread pool.
+        """
+        data_keys = [key for key in keys if self._is_data_key(key)]
+        values = {}
+        for key in set(keys).difference(data_keys):
+            values[key] = self._get_or_none(key)
+
+        num_workers = min(self.max_concurrent_loads, len(data_keys))
+        if num_workers <= 1:
+            values.update((key, self._get_or_none(key)) for key in data_keys)
+        else:
+            # with hooks, the time spent waiting for a thread is recorded too
+            queued = time.perf_counter() if self.hooks else None
+            with ThreadPoolExecutor(num_workers) as executor:
+                load = partial(self._get_or_none, queued=queued)
+                loaded = executor.map(load, data_keys)
+                values.update(zip(data_keys, loaded))
+        return {key: value for key, value in values.items() if value is not None}
 
     def __setitem__(self, item, value):
         raise NotImplementedError("Read-only access provided.")
@@ -240,9 +533,45 @@ class HypotheticZarrStore(MutableMapping):
         return self.keys()
 
     def __len__(self):
-        # slow, could be calculated...
-        # for now use zarr.storage.DirectoryStore implementation
-        return sum(1 for _ in self.keys())
+        # counted from the number of chunks rather than by listing the keys
+        num_keys = len(self.ROOT_KEYS)
+        for var in self.vars.values():
+            num_keys += len(self.META_KEYS) + int(np.prod(self._num_chunks(var)))
+        return num_keys
+
+    def __contains__(self, item):
+        # checked against the chunk grid, no chunk is loaded to answer this
+        # (so a chunk whose file turns out to be missing is still contained)
+        try:
+            var_name, key = self._split_key(item)
+        except KeyError:
+            return False
+        if key in self.ROOT_KEYS or key in self.META_KEYS:
+            return self._is_meta_key(var_name, key)
+        if var_name not in self.vars:
+            return False
+        try:
+            chunk_idxs = tuple(int(x) for x in key.split("."))
+        except ValueError:
+            return False
+        num_chunks = self._num_chunks(self.vars[var_name])
+        return len(chunk_idxs) == len(num_chunks) and all(
+            0 <= i < n for i, n in zip(chunk_idxs, num_chunks)
+        )
+
+    def listdir(self, path=None):
+        # used by zarr.storage.listdir in place of walking all the keys
+        path = (path or "").strip("/")
+        if not path:
+            return sorted(self.ROOT_KEYS + list(self.vars))
+        if path not in self.vars:
+            return []
+        return self.META_KEYS + list(self._chunk_keys(self.vars[path]))
+
+    def _chunk_keys(self, var):
+        chunk_iters = [range(x) for x in self._num_chunks(var)]
+        for chunk_idx in product(*chunk_iters):
+            yield ".".join(str(x) for x in chunk_idx)
 
     def keys(self):
         for key in self.ROOT_KEYS:
@@ -251,13 +580,7 @@ class HypotheticZarrStore(MutableMapping):
         for name, var in self.vars.items():
             for key in self.META_KEYS:
                 yield f"{name}/{key}"
-            num_chunks = self._num_chunks(var)
-            chunk_iters = [range(x) for x in num_chunks]
-            # slow, likely not to be used often
-            # could calculate faster (at the cost of more memory)
-            # by using np.meshgrid for cartesian products etc.
-            for chunk_idx in product(*chunk_iters):
-                chunk_idx = ".".join(str(x) for x in chunk_idx)
+            for chunk_idx in self._chunk_keys(var):
                 yield f"{name}/{chunk_idx}"
 
     @staticmethod
@@ -291,17 +614,35 @@ class HypotheticZarrStore(MutableMapping):
 
 
 class HypotheticZarrCloner(HypotheticZarrStore):
-    def __init__(self, target, *args, **kwargs):
+    # with data_only=True only data chunks are written to the target, which
+    # suits a cache shared by stores that differ in shape (e.g. end time)
+    def __init__(self, target, *args, data_only=False, **kwargs):
         if not isinstance(target, MutableMapping):
             raise ValueError("Target must be a MutableMapping")
         self.target = target
+        self.data_only = data_only
         super().__init__(*args, **kwargs)
 
     # keeps chunking exactly the same
     def __getitem__(self, item):
+        if self.data_only:
+            return super().__getitem__(item)
         try:
             return self.target[item]
         except KeyError:
             value = super().__getitem__(item)
             self.target[item] = value
             return value
+
+    def _load_chunk(self, var_name, key):
+        if not self.data_only:
+            return super()._load_chunk(var_name, key)
+        item = f"{var_name}/{key}"
+        try:
+            value = self.target[item]
+            annotate(cache="disk")
+            return value
+        except KeyError:
+            value = super()._load_chunk(var_name, key)
+            self.target[item] = value
+            return value
@@ -27,7 +27,7 @@ setup(
         "Topic :: Software Development :: Libraries :: Python Modules",
         "Natural Language :: English",
     ],
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     install_requires=[
         "numpy>=1.11",
         "dask>=1.0",
@@ -38,6 +38,7 @@ setup(
         "intake",
         "intake-xarray",
         "toolz",
+        "fasteners",
     ],
     zip_safe=True,
     long_description=long_description,
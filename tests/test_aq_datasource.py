@@ -47,11 +47,16 @@ def test_init():
     )
 
 
-def test_from_cat():
+def test_from_cat(monkeypatch):
     import os
 
     import intake
 
+    from intake_informaticslab.datasources.dataset import MODataset
+
+    # resolve 'latest' without waiting for the store (unreachable in CI)
+    monkeypatch.setattr(MODataset, "_find_latest", lambda self: None)
+
     cat_path = os.path.join(
         os.path.dirname(__file__), "../intake_informaticslab/cats/air_quality_cat.yaml"
     )
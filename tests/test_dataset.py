@@ -0,0 +1,617 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+DIAG = "temperature_at_screen_level"
+
+
+def make_dataset(url_prefix, **kwargs):
+    from intake_informaticslab.datasources.dataset import MODataset
+
+    storage_options = {"data_protocol": "file", "url_prefix": str(url_prefix)}
+    storage_options.update(kwargs.pop("storage_options", {}))
+    return MODataset(
+        start_cycle="20200101T0000Z",
+        end_cycle=kwargs.pop("end_cycle", "20200101T0100Z"),
+        model="mo-atmospheric-mogreps-uk",
+        dims=[
+            "forecast_reference_time",
+            "forecast_period",
+            "realization",
+            "projection_y_coordinate",
+            "projection_x_coordinate",
+        ],
+        diagnostics=[DIAG],
+        static_coords={
+            "realization": {"data": [0, 1, 2]},
+            "projection_y_coordinate": {"data": {"start": 100, "stop": 200, "num": 10}},
+            "projection_x_coordinate": {"data": {"start": 100, "stop": 200, "num": 8}},
+        },
+        cycle_freq="1H",
+        start_lead_time="0H",
+        end_lead_time="1H",
+        lead_time_freq="1H",
+        **storage_options,
+        **kwargs,
+    )
+
+
+def write_file(dataset, cycle, lead, value=None):
+    """Write a netCDF file where the dataset expects to find it."""
+    cycle = pd.Timestamp(cycle)
+    lead = pd.Timedelta(lead)
+    coords = {
+        name: var.values
+        for name, var in dataset.static_coords.items()
+        if name in dataset.dims
+    }
+    shape = tuple(len(values) for values in coords.values())
+    if value is None:
+        data = np.arange(np.prod(shape), dtype="float32").reshape(shape)
+    else:
+        data = np.full(shape, value, dtype="float32")
+    ds = xr.Dataset(
+        {"air_temperature": (tuple(coords), data)},
+        coords=dict(coords, forecast_reference_time=cycle, forecast_period=lead),
+    )
+    url = dataset._get_url(diagnostic=DIAG, cycle_time=cycle, lead_time=lead)
+    path = dataset._url_to_path(url)
+    dataset.fs.makedirs(path.rsplit("/", 1)[0], exist_ok=True)
+    ds.to_netcdf(
+        path,
+        engine="h5netcdf",
+        encoding={"air_temperature": {"zlib": True, "chunksizes": (1, 5, 4)}},
+    )
+    return data
+
+
+def test_filesystem_shared_between_reads(tmp_path):
+    dataset = make_dataset(tmp_path)
+    expected = write_file(dataset, "2020-01-01T00:00", "0H")
+    fs = dataset.fs
+    loaded = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    np.testing.assert_array_equal(loaded.values, expected)
+    assert dataset.fs is fs
+
+
+def test_pool_options_not_passed_to_filesystem(tmp_path):
+    dataset = make_dataset(tmp_path, storage_options={"pool_size": 2, "keep_alive": 5})
+    assert dataset.pool_size == 2
+    assert "pool_size" not in dataset.storage_options
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    assert dataset.ds[DIAG].isel(forecast_period=0).notnull().any()
+
+
+def test_pickle_roundtrip(tmp_path):
+    dataset = make_dataset(tmp_path, storage_options={"pool_size": 2})
+    dataset.fs
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert restored._fs is None
+    assert restored.fs.protocol == dataset.fs.protocol
+
+
+def test_lazy_read_mode(tmp_path):
+    dataset = make_dataset(tmp_path, read_mode="lazy")
+    expected = write_file(dataset, "2020-01-01T01:00", "1H")
+    loaded = dataset.ds[DIAG].isel(forecast_reference_time=1, forecast_period=1)
+    np.testing.assert_array_equal(loaded.values, expected)
+
+
+def test_invalid_read_mode(tmp_path):
+    with pytest.raises(ValueError):
+        make_dataset(tmp_path, read_mode="sideways")
+
+
+@pytest.mark.parametrize("read_mode", ["download", "lazy"])
+def test_sub_file_chunks(tmp_path, read_mode):
+    chunks = {"realization": 2, "projection_x_coordinate": 3, "height": 1}
+    dataset = make_dataset(tmp_path, read_mode=read_mode, chunks=chunks)
+    expected = write_file(dataset, "2020-01-01T00:00", "1H")
+    da = dataset.ds[DIAG]
+    assert da.chunks[2:] == ((2, 1), (10,), (3, 3, 2))
+    loaded = da.isel(forecast_reference_time=0, forecast_period=1)
+    np.testing.assert_array_equal(loaded.values, expected)
+
+
+def test_cannot_split_files_along_dynamic_dims(tmp_path):
+    with pytest.raises(ValueError):
+        make_dataset(tmp_path, chunks={"forecast_period": 1})
+
+
+def test_reference_read_mode(tmp_path):
+    from intake_informaticslab.datasources.references import build_reference_index
+
+    index_path = str(tmp_path / "refs.json")
+    dataset = make_dataset(tmp_path)
+    expected = write_file(dataset, "2020-01-01T00:00", "1H")
+    index = build_reference_index(dataset, index_path, end_cycle="20200101T0000Z")
+    assert len(index) == 2
+    assert (
+        index.get(
+            dataset._get_url(
+                DIAG, pd.Timestamp("2020-01-01"), lead_time=pd.Timedelta(0)
+            )
+        )
+        is None
+    )
+
+    dataset = make_dataset(
+        tmp_path,
+        read_mode="reference",
+        reference_index=index_path,
+        chunks={"projection_y_coordinate": 3},
+    )
+    loaded = dataset.ds[DIAG].isel(forecast_reference_time=0)
+    np.testing.assert_array_equal(loaded.isel(forecast_period=1).values, expected)
+    assert loaded.isel(forecast_period=0).isnull().all()
+
+
+def test_reference_index_files_published_later(tmp_path):
+    from intake_informaticslab.datasources.references import build_reference_index
+
+    index_path = str(tmp_path / "refs.json")
+    dataset = make_dataset(tmp_path)
+    index = build_reference_index(dataset, index_path, end_cycle="20200101T0000Z")
+    url = dataset._get_url(DIAG, pd.Timestamp("2020-01-01"), lead_time=pd.Timedelta(0))
+    assert url in index and index.get(url) is None
+
+    # published after the index was built, so read lazily until it is extended
+    expected = write_file(dataset, "2020-01-01T00:00", "0H")
+    dataset = make_dataset(tmp_path, read_mode="reference", reference_index=index_path)
+    loaded = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    np.testing.assert_array_equal(loaded.values, expected)
+
+    index = build_reference_index(dataset, index_path, end_cycle="20200101T0000Z")
+    assert index.get(url) is not None
+    dataset = make_dataset(tmp_path, read_mode="reference", reference_index=index_path)
+    loaded = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    np.testing.assert_array_equal(loaded.values, expected)
+
+
+def rewrite_file(dataset, cycle, lead, encoding):
+    """Write a file written by write_file again with another encoding."""
+    url = dataset._get_url(DIAG, pd.Timestamp(cycle), lead_time=pd.Timedelta(lead))
+    path = dataset._url_to_path(url)
+    with xr.open_dataset(path, engine="h5netcdf") as ds:
+        ds = ds.load()
+    ds.to_netcdf(path, engine="h5netcdf", encoding={"air_temperature": encoding})
+    return url
+
+
+def test_reference_index_masks_missing_values(tmp_path):
+    from intake_informaticslab.datasources.references import build_reference_index
+
+    dataset = make_dataset(tmp_path)
+    expected = write_file(dataset, "2020-01-01T00:00", "0H")
+    rewrite_file(
+        dataset, "2020-01-01T00:00", "0H", {"missing_value": 0.0, "_FillValue": None}
+    )
+    expected[0, 0, 0] = np.nan
+    index_path = str(tmp_path / "refs.json")
+    build_reference_index(dataset, index_path, end_cycle="20200101T0000Z")
+
+    dataset = make_dataset(tmp_path, read_mode="reference", reference_index=index_path)
+    loaded = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    np.testing.assert_array_equal(loaded.values, expected)
+
+
+def test_reference_index_skips_unsupported_filters(tmp_path):
+    from intake_informaticslab.datasources.references import build_reference_index
+
+    dataset = make_dataset(tmp_path)
+    expected = write_file(dataset, "2020-01-01T00:00", "0H")
+    # checksums can't be decoded from raw chunks
+    url = rewrite_file(dataset, "2020-01-01T00:00", "0H", {"fletcher32": True})
+    index_path = str(tmp_path / "refs.json")
+    index = build_reference_index(dataset, index_path, end_cycle="20200101T0000Z")
+    assert url not in index
+
+    # so the file is read lazily instead
+    dataset = make_dataset(tmp_path, read_mode="reference", reference_index=index_path)
+    loaded = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    np.testing.assert_array_equal(loaded.values, expected)
+
+
+def test_memory_cache(tmp_path):
+    dataset = make_dataset(tmp_path, memory_cache_bytes=2**20)
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    da = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    da.values
+    da.values
+    assert dataset.cache_info()["memory"]["hits"] >= 1
+    assert dataset.cache_info()["disk"] is None
+
+
+def test_disk_cache(tmp_path):
+    cache_dir = tmp_path / "cache"
+    dataset = make_dataset(tmp_path / "data", cache_dir=str(cache_dir))
+    expected = write_file(dataset, "2020-01-01T00:00", "0H")
+    da = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    da.values
+
+    # chunks are read back from the cache without the original files
+    dataset.fs.rm(str(tmp_path / "data"), recursive=True)
+    dataset = make_dataset(tmp_path / "data", cache_dir=str(cache_dir))
+    da = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    np.testing.assert_array_equal(da.values, expected)
+    assert dataset.cache_info()["disk"]["hits"] >= 1
+
+
+def test_chunk_url_matches_get_url(tmp_path):
+    dataset = make_dataset(tmp_path)
+    cycle = dataset.dynamic_coords["forecast_reference_time"].values[1]
+    lead = dataset.dynamic_coords["forecast_period"].values[1]
+    expected = dataset._get_url(
+        DIAG, cycle_time=pd.Timestamp(cycle), lead_time=pd.Timedelta(lead)
+    )
+    assert dataset._get_chunk_url(DIAG, 1, 1) == expected
+    assert dataset.static_coords is dataset.static_coords
+
+
+def test_missing_files_are_not_requested_again(tmp_path):
+    from intake_informaticslab.datasources.missing import MissingURLCache
+
+    cache_dir = tmp_path / "cache"
+    dataset = make_dataset(
+        tmp_path / "data", cache_dir=str(cache_dir), missing_ttl=3600
+    )
+    da = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    assert da.isnull().all()
+    # the file appears, but is still taken to be missing until the TTL expires
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    dataset = make_dataset(
+        tmp_path / "data", cache_dir=str(cache_dir), missing_ttl=3600
+    )
+    da = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    assert da.isnull().all()
+    assert dataset.cache_info()["missing"]["hits"] >= 1
+    assert pickle.loads(pickle.dumps(dataset))._missing is dataset._missing
+
+    # a fresh process reads the entries back from cache_dir once written
+    dataset._missing.flush()
+    restored = MissingURLCache(3600, str(cache_dir / "missing.json"))
+    assert len(restored) == 1
+
+    # off by default, so newly published files are read straight away
+    dataset = make_dataset(tmp_path / "data", cache_dir=str(cache_dir))
+    assert dataset._missing is None
+    da = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    assert da.notnull().all()
+
+
+def test_missing_url_cache_expires():
+    import time
+
+    from intake_informaticslab.datasources.missing import MissingURLCache
+
+    cache = MissingURLCache(ttl=0.05)
+    cache.add("file://nowhere.nc")
+    assert "file://nowhere.nc" in cache
+    time.sleep(0.1)
+    assert "file://nowhere.nc" not in cache
+    assert len(cache) == 0
+
+
+def test_missing_url_cache_batches_writes(tmp_path, monkeypatch):
+    import time
+
+    from intake_informaticslab.datasources.missing import MissingURLCache
+
+    path = tmp_path / "missing.json"
+    cache = MissingURLCache(ttl=60, path=str(path))
+    saves = []
+    save = cache._save
+    monkeypatch.setattr(cache, "_save", lambda: saves.append(1) or save())
+    for i in range(100):
+        cache.add(f"file://nowhere/{i}.nc")
+    assert not saves and not path.exists()
+    cache.flush()
+    cache.flush()
+    assert len(saves) == 1
+    assert len(MissingURLCache(60, str(path))) == 100
+
+    # and, unless flushed, shortly after the first new entry
+    cache.FLUSH_DELAY = 0.01
+    cache.add("file://nowhere/late.nc")
+    time.sleep(0.5)
+    assert len(saves) == 2
+
+
+def test_inventory(tmp_path):
+    dataset = make_dataset(tmp_path, inventory=True)
+    requested = []
+    load_data = dataset._load_data
+
+    def counting_load_data(url, *args, **kwargs):
+        requested.append(url)
+        return load_data(url, *args, **kwargs)
+
+    dataset._load_data = counting_load_data
+    expected = write_file(dataset, "2020-01-01T00:00", "1H")
+    available = dataset.ds[f"{DIAG}_available"]
+    assert available.dims == ("forecast_reference_time", "forecast_period")
+    np.testing.assert_array_equal(available.values, [[False, True], [False, False]])
+
+    # files known to be missing are not requested
+    values = dataset.ds[DIAG].isel(projection_x_coordinate=0).values
+    np.testing.assert_array_equal(values[0, 1], expected[..., 0])
+    assert np.isnan(values[0, 0]).all() and np.isnan(values[1]).all()
+    assert len(requested) == 1
+
+    write_file(dataset, "2020-01-01T01:00", "0H")
+    dataset.refresh_inventory()
+    available = dataset.ds[f"{DIAG}_available"]
+    np.testing.assert_array_equal(available.values, [[False, True], [True, False]])
+    assert dataset.cache_info()["inventory"]["available"] == 2
+
+
+def test_inventory_of_daily_files(tmp_path):
+    from intake_informaticslab.datasources.aq_datasource import AQDataset
+
+    dataset = AQDataset(
+        start_datetime="20200101T0000Z",
+        end_datetime="20200103T2300Z",
+        model="aqum",
+        dims=["time", "projection_y_coordinate", "projection_x_coordinate"],
+        diagnostics=["o3"],
+        static_coords={
+            "projection_y_coordinate": {"data": {"start": 0, "stop": 1, "num": 2}},
+            "projection_x_coordinate": {"data": {"start": 0, "stop": 1, "num": 2}},
+        },
+        timestep="1H",
+        storage_options={"data_protocol": "file", "url_prefix": str(tmp_path)},
+        inventory=True,
+    )
+    url = dataset._get_blob_url("o3", time=pd.Timestamp("2020-01-02"))
+    path = dataset._url_to_path(url)
+    dataset.fs.makedirs(path.rsplit("/", 1)[0], exist_ok=True)
+    dataset.fs.touch(path)
+    available = dataset.inventory.refresh().available("o3")
+    np.testing.assert_array_equal(available, [False, True, False])
+    mask = dataset.availability()["o3_available"]
+    assert mask.dims == ("time",)
+    np.testing.assert_array_equal(mask.values, np.repeat([False, True, False], 24))
+    assert dataset._known_missing(
+        {"variable_name": "o3", "selection": {"time": slice(0, 24)}}
+    )
+
+
+def test_latest_end_cycle(tmp_path, monkeypatch):
+    from intake_informaticslab.datasources import dataset as dataset_module
+
+    monkeypatch.setattr(
+        dataset_module, "_utcnow", lambda: pd.Timestamp("2020-01-01T05:30")
+    )
+    dataset = make_dataset(tmp_path)
+    for cycle in pd.date_range("2019-12-31T20:00", "2020-01-01T01:00", freq="1H"):
+        write_file(dataset, cycle, "0H")
+
+    dataset = make_dataset(tmp_path, end_cycle="latest")
+    # only resolved once the data is used
+    assert dataset._end_cycle == "latest"
+    assert dataset.ds.sizes["forecast_reference_time"] == 2
+    assert dataset.end_cycle == "20200101T0100"
+
+    # the answer is remembered for latest_ttl seconds
+    write_file(dataset, "2020-01-01T02:00", "0H")
+    assert make_dataset(tmp_path, end_cycle="latest").end_cycle == "20200101T0100"
+    dataset = make_dataset(tmp_path, end_cycle="latest", latest_ttl=None)
+    assert dataset.end_cycle == "20200101T0200"
+
+
+def test_latest_end_cycle_falls_back_to_data_delay(tmp_path, monkeypatch):
+    from intake_informaticslab.datasources import dataset as dataset_module
+
+    monkeypatch.setattr(
+        dataset_module, "_utcnow", lambda: pd.Timestamp("2020-01-03T06:00")
+    )
+    dataset = make_dataset(tmp_path, end_cycle="latest")
+    assert dataset.end_cycle == "20200102T0000"
+
+
+def test_latest_end_cycle_fails_fast(tmp_path, monkeypatch):
+    from intake_informaticslab.datasources import dataset as dataset_module
+
+    monkeypatch.setattr(
+        dataset_module, "_utcnow", lambda: pd.Timestamp("2020-01-03T06:00")
+    )
+    probes = []
+
+    def unreachable(self, url):
+        probes.append(url)
+        raise ConnectionError("store unreachable")
+
+    monkeypatch.setattr(dataset_module.MODataset, "_exists", unreachable)
+    dataset = make_dataset(tmp_path, end_cycle="latest", latest_ttl=None)
+    assert not probes
+    assert dataset.end_cycle == "20200102T0000"
+    assert len(probes) == 1
+
+
+@pytest.mark.parametrize("read_mode", ["download", "lazy"])
+def test_decode_plan(tmp_path, read_mode):
+    chunks = {"projection_x_coordinate": 3}
+    dataset = make_dataset(tmp_path, read_mode=read_mode, chunks=chunks)
+    first = write_file(dataset, "2020-01-01T00:00", "0H")
+    second = write_file(dataset, "2020-01-01T01:00", "1H", value=2)
+    da = dataset.ds[DIAG]
+    np.testing.assert_array_equal(da[0, 0].values, first)
+    assert dataset._decode_plans[DIAG]["variable"] == "air_temperature"
+    assert dataset._decode_plans[DIAG]["dims"][-1] == "projection_x_coordinate"
+    np.testing.assert_array_equal(da[1, 1].values, second)
+
+
+@pytest.mark.parametrize(
+    "dtype, encoding",
+    [
+        ("int16", {"scale_factor": 0.5, "_FillValue": -1}),
+        ("int16", {"scale_factor": 0.5, "add_offset": 10.0}),
+        ("int32", {"scale_factor": 0.5, "_FillValue": -1}),
+        ("float64", {"_FillValue": -1.0}),
+    ],
+)
+@pytest.mark.filterwarnings("ignore:saving variable x with floating point data")
+def test_decode_plan_follows_xarray(tmp_path, dtype, encoding):
+    from intake_informaticslab.datasources.decode import (
+        make_decode_plan,
+        read_with_plan,
+    )
+
+    path = str(tmp_path / "data.nc")
+    data = np.arange(12.0).reshape(3, 4)
+    if "_FillValue" in encoding:
+        data[0, 0] = np.nan
+    xr.Dataset({"x": (("y", "z"), data)}).to_netcdf(
+        path, engine="h5netcdf", encoding={"x": dict(encoding, dtype=dtype)}
+    )
+    expected = xr.open_dataset(path, engine="h5netcdf")["x"].values
+    plan = make_decode_plan(path, "x")
+    decoded = read_with_plan(path, plan)
+    assert decoded.dtype == expected.dtype
+    np.testing.assert_array_equal(decoded, expected)
+
+
+def test_decode_plan_checks_layout(tmp_path):
+    from intake_informaticslab.datasources.decode import (
+        PlanMismatch,
+        make_decode_plan,
+        read_with_plan,
+    )
+
+    path = str(tmp_path / "data.nc")
+    xr.Dataset({"x": (("y", "z"), np.zeros((3, 4)))}).to_netcdf(
+        path, engine="h5netcdf"
+    )
+    plan = make_decode_plan(path, "x")
+    for dims, shape in [(("y", "z"), (3, 5)), (("z", "y"), (3, 4))]:
+        xr.Dataset({"x": (dims, np.zeros(shape))}).to_netcdf(
+            path, engine="h5netcdf"
+        )
+        with pytest.raises(PlanMismatch):
+            read_with_plan(path, plan)
+
+
+def test_decode_processes(tmp_path):
+    dataset = make_dataset(tmp_path, decode_processes=2)
+    expected = [
+        write_file(dataset, "2020-01-01T00:00", lead, value=i)
+        for i, lead in enumerate(["0H", "1H"])
+    ]
+    try:
+        values = dataset.ds[DIAG].isel(forecast_reference_time=0).values
+        np.testing.assert_array_equal(values, expected)
+        assert dataset._decode_pool._executor is not None
+        restored = pickle.loads(pickle.dumps(dataset))
+        assert restored._decode_pool._executor is None
+    finally:
+        dataset._decode_pool.shutdown()
+
+
+def test_adaptive_concurrency(tmp_path):
+    dataset = make_dataset(tmp_path, adaptive_concurrency={"initial": 2})
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    dataset.ds[DIAG].isel(forecast_reference_time=0).values
+    info = dataset.cache_info()["limiter"]
+    assert info["requests"] == 2
+    assert info["in_flight"] == 0
+    assert (
+        make_dataset(tmp_path, adaptive_concurrency=True)._limiter is dataset._limiter
+    )
+
+
+@pytest.mark.parametrize("read_mode", ["lazy", "reference"])
+def test_adaptive_concurrency_covers_every_read_mode(tmp_path, read_mode):
+    from intake_informaticslab.datasources.references import build_reference_index
+
+    index_path = str(tmp_path / "refs.json")
+    dataset = make_dataset(tmp_path)
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    build_reference_index(dataset, index_path, end_cycle="20200101T0000Z")
+    dataset = make_dataset(
+        tmp_path,
+        read_mode=read_mode,
+        reference_index=index_path if read_mode == "reference" else None,
+        adaptive_concurrency=True,
+        retries=1,
+        inventory=True,
+    )
+    open_file = dataset.fs.open
+    failures = []
+
+    def flaky_open(path, *args, **kwargs):
+        if not failures:
+            failures.append(path)
+            raise ConnectionResetError(path)
+        return open_file(path, *args, **kwargs)
+
+    dataset.fs.open = flaky_open
+    values = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    assert not np.isnan(values.values).any()
+    assert dataset.cache_info()["requests"]["retried"] == 1
+    # the listings of the two cycles, then the failed read and its retry
+    assert dataset.cache_info()["limiter"]["requests"] == 4
+
+
+def test_transient_errors_are_retried(tmp_path):
+    dataset = make_dataset(tmp_path, retries=1)
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    cat_file = dataset.fs.cat_file
+    failures = []
+
+    def flaky_cat_file(path, *args, **kwargs):
+        if not failures:
+            failures.append(path)
+            raise ConnectionResetError(path)
+        return cat_file(path, *args, **kwargs)
+
+    dataset.fs.cat_file = flaky_cat_file
+    values = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    assert not np.isnan(values.values).any()
+    assert dataset.cache_info()["requests"]["retried"] == 1
+
+
+def test_chunk_events(tmp_path):
+    from intake_informaticslab.zarrhypothetic.instrumentation import ChunkRecorder
+
+    recorder = ChunkRecorder(keep_events=True)
+    dataset = make_dataset(tmp_path, hooks=[recorder])
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    dataset.ds[DIAG].isel(forecast_reference_time=0).values
+    events = {event.url: event for event in recorder.events}
+    url = dataset._get_url(
+        diagnostic=DIAG,
+        cycle_time=pd.Timestamp("2020-01-01T00:00"),
+        lead_time=pd.Timedelta("0H"),
+    )
+    assert events[url].outcome == "ok"
+    assert events[url].nbytes > 0
+    assert {"fetch", "decode", "copy"} <= set(events[url].phases)
+    assert recorder.summary()["outcomes"] == {"ok": 1, "missing": 1}
+
+
+def test_trace(tmp_path):
+    import json
+
+    dataset = make_dataset(tmp_path)
+    write_file(dataset, "2020-01-01T00:00", "0H")
+    path = tmp_path / "trace.json"
+    with dataset.trace(path):
+        dataset.ds[DIAG].isel(forecast_reference_time=0).values
+    trace = json.loads(path.read_text())["traceEvents"]
+    categories = {event.get("cat") for event in trace}
+    assert {"chunk", "fetch", "decode", "copy"} <= categories
+    assert dataset.hooks == []
+
+
+def test_dataset_cloudpickles_for_process_schedulers(tmp_path):
+    import cloudpickle
+
+    dataset = make_dataset(tmp_path, missing_ttl=60)
+    expected = write_file(dataset, "2020-01-01T00:00", "0H")
+    clone = cloudpickle.loads(cloudpickle.dumps(dataset))
+    assert clone._missing is dataset._missing
+    data = dataset.ds[DIAG].isel(forecast_reference_time=0, forecast_period=0)
+    np.testing.assert_array_equal(data.compute(scheduler="processes"), expected)
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+
+def run_python(code):
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout.split()
+
+
+def test_import_is_lazy():
+    heavy = run_python(
+        "import sys, intake_informaticslab; "
+        "print(*[m for m in ('intake', 'xarray', 'zarr', 'pandas', 'fsspec') "
+        "if m in sys.modules])"
+    )
+    assert heavy == []
+
+
+def test_catalogs_and_datasources_load_on_use():
+    import intake_informaticslab
+
+    assert "mogreps_uk" in list(intake_informaticslab.mogreps_cat)
+    assert intake_informaticslab.cat is intake_informaticslab.cat
+    assert "weather_forecasts" in list(intake_informaticslab.cat)
+    from intake_informaticslab import MetOfficeDataSource
+    from intake_informaticslab.datasources import (
+        MetOfficeDataSource as datasources_class,
+    )
+
+    assert MetOfficeDataSource is datasources_class
+    assert "aq_cat" in dir(intake_informaticslab)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+
+class ThrottledError(Exception):
+    status = 503
+
+
+def test_window_grows_and_shrinks():
+    from intake_informaticslab.datasources.limiter import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(initial=4, max_limit=5, latency_factor=None)
+    for _ in range(20):
+        with limiter.slot():
+            pass
+    assert limiter.limit == 5
+
+    with pytest.raises(ThrottledError):
+        with limiter.slot():
+            raise ThrottledError()
+    assert limiter.limit == 2.5
+    info = limiter.info()
+    assert info["throttled"] == 1 and info["decreases"] == 1
+    assert info["in_flight"] == 0
+
+    # other errors, including missing files, leave the window alone
+    for error in (FileNotFoundError, ValueError):
+        with pytest.raises(error):
+            with limiter.slot():
+                raise error()
+    assert limiter.limit == 2.5
+
+
+def test_in_flight_requests_are_capped():
+    from intake_informaticslab.datasources.limiter import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(initial=2, max_limit=2)
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def request():
+        with limiter.slot():
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert limiter.info()["waits"] > 0
+
+
+def test_shared_by_account():
+    import pickle
+
+    from intake_informaticslab.datasources.limiter import AdaptiveLimiter, limiter_info
+
+    limiter = AdaptiveLimiter.shared("abfs:test-account", initial=3)
+    assert AdaptiveLimiter.shared("abfs:test-account") is limiter
+    assert pickle.loads(pickle.dumps(limiter)) is limiter
+    assert limiter_info()["abfs:test-account"]["limit"] == 3
+    with pytest.warns(RuntimeWarning, match="initial"):
+        assert AdaptiveLimiter.shared("abfs:test-account", initial=5) is limiter
+
+
+def test_window_shrinks_when_latency_climbs():
+    from intake_informaticslab.datasources.limiter import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(initial=8, latency_factor=2)
+    for latency in [0.01] + [1.0] * 5:
+        limiter.acquire()
+        limiter.release(latency=latency)
+    assert limiter.info()["slow"] > 0
+    # a burst of slow requests only shrinks the window once per round-trip
+    assert limiter.info()["decreases"] == 1
+    assert limiter.limit < 8
+
+
+def test_window_ignores_latency_by_default():
+    from intake_informaticslab.datasources.limiter import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(initial=8)
+    # small and large files alternating don't look like an overloaded store
+    for latency in [0.01, 1.0] * 20:
+        limiter.acquire()
+        limiter.release(latency=latency)
+    assert limiter.info()["decreases"] == 0
+    assert limiter.limit > 8
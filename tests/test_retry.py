@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+
+def flaky(failures, error=ConnectionError):
+    calls = []
+
+    def request():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error("flaky")
+        return b"data"
+
+    return request, calls
+
+
+def test_transient_errors_are_retried():
+    from intake_informaticslab.datasources.retry import RequestPolicy
+
+    policy = RequestPolicy(retries=3, backoff=0.001)
+    request, calls = flaky(2)
+    assert policy.call(request) == b"data"
+    assert len(calls) == 3
+    assert policy.info()["retried"] == 2
+
+    request, calls = flaky(5)
+    with pytest.raises(ConnectionError):
+        policy.call(request)
+    assert len(calls) == 4
+    assert policy.info()["failed"] == 1
+
+
+def test_missing_files_are_not_retried():
+    from intake_informaticslab.datasources.retry import RequestPolicy
+
+    policy = RequestPolicy(retries=3, backoff=0.001)
+    request, calls = flaky(1, FileNotFoundError)
+    with pytest.raises(FileNotFoundError):
+        policy.call(request)
+    assert len(calls) == 1
+    assert policy.info() == {
+        "requests": 1,
+        "retried": 0,
+        "failed": 0,
+        "hedged": 0,
+        "hedge_wins": 0,
+    }
+
+
+def test_slow_requests_are_hedged():
+    from intake_informaticslab.datasources.retry import RequestPolicy
+
+    policy = RequestPolicy(hedge=True, hedge_min_samples=5)
+    for _ in range(5):
+        policy.call(lambda: time.sleep(0.01))
+    assert policy.hedge_after() is not None
+
+    release = threading.Event()
+    calls = []
+
+    def request():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    assert policy.call(request) == "fast"
+    release.set()
+    info = policy.info()
+    assert info["hedged"] == 1 and info["hedge_wins"] == 1
+
+
+def test_hedging_under_concurrency():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from intake_informaticslab.datasources.retry import RequestPolicy
+
+    policy = RequestPolicy(hedge=True, hedge_min_samples=20)
+    limit = threading.BoundedSemaphore(8)
+    calls = []
+
+    def request():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return b"data"
+
+    # 32 threads through a limit of 8 at a time: waiting for the slot is not
+    # latency, so queued requests aren't hedged
+    start = time.perf_counter()
+    with ThreadPoolExecutor(32) as executor:
+        results = list(
+            executor.map(lambda _: policy.call(request, slot=lambda: limit), range(320))
+        )
+    wall = time.perf_counter() - start
+    assert results == [b"data"] * 320
+    info = policy.info()
+    # hedges are capped by the budget (5% of requests and a burst of 4)
+    assert info["hedged"] <= 0.05 * 320 + 4
+    assert len(calls) == 320 + info["hedged"]
+    # most requests ran on the calling threads
+    assert sum(name.startswith("hedged-request") for name in calls) <= 100
+    # 40 rounds of 8 requests of 50ms
+    assert wall < 2 * 40 * 0.05
@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+
+def test_catalog_entries():
+    from intake_informaticslab.synthetic import catalog_entries
+
+    entries = catalog_entries()
+    assert {
+        "mogreps_uk/single_level",
+        "mogreps_g/depth_level",
+        "air_quality_hourly",
+        "ukv_daily_timeseries",
+    } <= set(entries)
+    driver, args = entries["mogreps_uk/height_level"]
+    assert driver.endswith("MetOfficeDataSource")
+    assert "height" in args["static_coords"]
+
+
+@pytest.mark.parametrize(
+    "name, start, end",
+    [
+        ("mogreps_uk/single_level", "20200101T0000Z", "20200101T0100Z"),
+        ("air_quality_hourly", "20200101T0000Z", "20200102T2300Z"),
+        ("ukv_daily_timeseries", "20200101T0000Z", "20200103T0000Z"),
+    ],
+)
+def test_archive_layouts(tmp_path, name, start, end):
+    from intake_informaticslab.synthetic import make_dataset, write_archive
+
+    dataset = make_dataset(
+        name,
+        start,
+        end,
+        url_prefix=str(tmp_path),
+        grid_reduction=32,
+        forecast_extent="1H",
+    )
+    dataset = make_dataset(
+        name,
+        start,
+        end,
+        url_prefix=str(tmp_path),
+        grid_reduction=32,
+        forecast_extent="1H",
+        diagnostics=dataset.diagnostics[:1],
+    )
+    summary = write_archive(dataset)
+    assert summary["files"] > 0 and summary["missing"] == 0
+    values = dataset.ds[dataset.diagnostics[0]].values
+    assert not np.isnan(values).any()
+
+
+def test_archive_in_memory_with_gaps(tmp_path):
+    from intake_informaticslab.synthetic import make_dataset, write_archive
+
+    dataset = make_dataset(
+        "air_quality_daily",
+        "20200101T0000Z",
+        "20200110T0000Z",
+        data_protocol="memory",
+        url_prefix=f"synthetic-{tmp_path.name}",
+        grid_reduction=32,
+    )
+    summary = write_archive(dataset, missing=0.5, seed=0)
+    assert summary["files"] + summary["missing"] == 10
+    assert 0 < summary["missing"] < 10
+    gaps = np.isnan(dataset.ds["daqi"].values).all(axis=(1, 2))
+    assert gaps.sum() == summary["missing"]
+
+
+def test_http_server_with_faults(tmp_path):
+    from intake_informaticslab.synthetic import (
+        SyntheticServer,
+        make_dataset,
+        write_archive,
+    )
+
+    options = dict(
+        grid_reduction=32,
+        forecast_extent="1H",
+        diagnostics=["temperature_at_screen_level"],
+    )
+    start, end = "20200101T0000Z", "20200101T0100Z"
+    name = "mogreps_uk/single_level"
+    write_archive(make_dataset(name, start, end, url_prefix=str(tmp_path), **options))
+
+    with SyntheticServer(tmp_path, error_rates={503: 0.3}, seed=1) as server:
+        dataset = make_dataset(
+            name,
+            start,
+            end,
+            data_protocol="http",
+            url_prefix=server.url_prefix,
+            retries=10,
+            **options,
+        )
+        values = dataset.ds["temperature_at_screen_level"].values
+        assert not np.isnan(values).any()
+        assert server.stats["errors"] > 0
+        assert dataset.cache_info()["requests"]["retried"] == server.stats["errors"]
+
+    with SyntheticServer(tmp_path, error_rates={404: 1.0}) as server:
+        dataset = make_dataset(
+            name,
+            start,
+            end,
+            data_protocol="http",
+            url_prefix=server.url_prefix,
+            **options,
+        )
+        assert np.isnan(dataset.ds["temperature_at_screen_level"].values).all()
+
+
+@pytest.mark.parametrize("read_mode", ["download", "lazy"])
+def test_corner_chunk_of_a_partial_day(tmp_path, read_mode):
+    from intake_informaticslab.synthetic import make_dataset, write_archive
+
+    def open_o3(**kwargs):
+        return make_dataset(
+            "air_quality_hourly",
+            "20200101T0000Z",
+            "20200102T0500Z",
+            url_prefix=str(tmp_path),
+            grid_reduction=32,
+            diagnostics=["o3"],
+            read_mode=read_mode,
+            **kwargs,
+        )
+
+    write_archive(open_o3())
+    expected = open_o3().ds["o3"].values
+    # 22 rows in chunks of 8, so the last chunk is on the edge of the grid
+    # as well as at the end of the (6 hour) second day
+    chunked = open_o3(chunks={"projection_y_coordinate": 8}).ds["o3"]
+    assert chunked.shape == (30, 22, 17)
+    np.testing.assert_array_equal(chunked.values, expected)
+    np.testing.assert_array_equal(chunked[24:, 16:].values, expected[24:, 16:])
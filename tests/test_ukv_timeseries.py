@@ -2,11 +2,16 @@ import numpy as np
 from xarray import Dataset
 
 
-def test_from_cat():
+def test_from_cat(monkeypatch):
     import os
 
     import intake
 
+    from intake_informaticslab.datasources.dataset import MODataset
+
+    # resolve 'latest' without waiting for the store (unreachable in CI)
+    monkeypatch.setattr(MODataset, "_find_latest", lambda self: None)
+
     cat_path = os.path.join(
         os.path.dirname(__file__),
         "../intake_informaticslab/cats/ukv_timeseries_cat.yaml",
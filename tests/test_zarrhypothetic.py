@@ -0,0 +1,487 @@
+import numpy as np
+import xarray as xr
+
+
+def make_store(loader=None, **kwargs):
+    from intake_informaticslab.zarrhypothetic.zarrhypothetic import (
+        HypotheticZarrStore,
+    )
+
+    calls = []
+
+    def default_loader(attrs):
+        calls.append(attrs)
+        return np.full((4, 3), attrs["time"], dtype="float32")
+
+    coord_vars = {
+        "time": xr.Variable(dims=("time",), data=np.arange(5)),
+        "y": xr.Variable(dims=("y",), data=np.arange(4)),
+        "x": xr.Variable(dims=("x",), data=np.arange(3)),
+    }
+    store = HypotheticZarrStore(
+        dims=("time", "y", "x"),
+        coord_vars=coord_vars,
+        data_vars=["temp"],
+        chunks=kwargs.pop("chunks", {"y": 4, "x": 3}),
+        loader_function=loader or default_loader,
+        **kwargs,
+    )
+    return store, calls
+
+
+def test_open_store():
+    store, calls = make_store()
+    ds = xr.open_zarr(store, consolidated=True)
+    np.testing.assert_array_equal(ds.temp.isel(y=0, x=0).values, np.arange(5))
+
+
+def test_lru_cache():
+    from intake_informaticslab.zarrhypothetic.cache import LRUChunkCache
+
+    chunk_bytes = 4 * 3 * 4
+    cache = LRUChunkCache(max_bytes=2 * chunk_bytes)
+    store, calls = make_store(cache=cache)
+
+    store["temp/0.0.0"]
+    store["temp/1.0.0"]
+    store["temp/0.0.0"]
+    assert len(calls) == 2
+    # budget is two chunks, so the least recently used one is evicted
+    store["temp/2.0.0"]
+    store["temp/0.0.0"]
+    assert len(calls) == 3
+    info = cache.info()
+    assert info["hits"] == 2
+    assert info["misses"] == 3
+    assert info["evictions"] == 1
+    assert info["current_bytes"] == 2 * chunk_bytes
+
+
+def test_disk_cache_lru_eviction(tmp_path):
+    import os
+    import time
+
+    from intake_informaticslab.zarrhypothetic.cache import DiskChunkCache
+
+    cache = DiskChunkCache(tmp_path, max_bytes=30, low_water=0.7)
+    cache["temp/0.0"] = b"a" * 10
+    cache["temp/1.0"] = b"b" * 10
+    # make 0.0 the most recently used entry
+    os.utime(tmp_path / "temp" / "0.0", (time.time() + 10, time.time() + 10))
+    cache["temp/2.0"] = b"c" * 10
+    cache["temp/3.0"] = b"d" * 10
+    assert sorted(cache) == ["temp/0.0", "temp/3.0"]
+    assert cache["temp/0.0"] == b"a" * 10
+    assert cache.info()["evictions"] == 2
+
+
+def test_disk_cache_lfu_eviction(tmp_path):
+    from intake_informaticslab.zarrhypothetic.cache import DiskChunkCache
+
+    cache = DiskChunkCache(tmp_path, max_bytes=20, policy="lfu", low_water=0.5)
+    cache["temp/0.0"] = b"a" * 10
+    cache["temp/1.0"] = b"b" * 10
+    cache["temp/1.0"]
+    cache["temp/2.0"] = b"c" * 10
+    assert "temp/1.0" in cache
+    assert "temp/0.0" not in cache
+
+
+def test_disk_cache_is_scanned_on_first_write(tmp_path, monkeypatch):
+    import pickle
+
+    from intake_informaticslab.zarrhypothetic.cache import DiskChunkCache
+
+    DiskChunkCache(tmp_path, max_bytes=30)["temp/0.0"] = b"a" * 10
+    scans = []
+    scan = DiskChunkCache._scan
+    monkeypatch.setattr(
+        DiskChunkCache, "_scan", lambda self: scans.append(1) or scan(self)
+    )
+    cache = pickle.loads(pickle.dumps(DiskChunkCache(tmp_path, max_bytes=30)))
+    assert cache["temp/0.0"] == b"a" * 10
+    assert not scans
+    cache["temp/1.0"] = b"b" * 5
+    assert len(scans) == 1
+    assert cache.info()["current_bytes"] == 15
+    assert DiskChunkCache(tmp_path, max_bytes=30).info()["current_bytes"] == 15
+
+
+def test_disk_cache_overwrites_are_not_double_counted(tmp_path):
+    from intake_informaticslab.zarrhypothetic.cache import DiskChunkCache
+
+    cache = DiskChunkCache(tmp_path, max_bytes=30)
+    for _ in range(5):
+        cache["temp/0.0"] = b"a" * 10
+    cache["temp/1.0"] = b"b" * 5
+    assert cache.info()["current_bytes"] == 15
+    assert cache.info()["evictions"] == 0
+    del cache["temp/0.0"]
+    assert cache.info()["current_bytes"] == 5
+    assert sorted(cache) == ["temp/1.0"]
+
+
+def test_cloner_data_only(tmp_path):
+    from intake_informaticslab.zarrhypothetic.zarrhypothetic import (
+        HypotheticZarrCloner,
+    )
+
+    target = {}
+    store, calls = make_store()
+    cloner = HypotheticZarrCloner(
+        target,
+        dims=store.dims,
+        coord_vars=store.coord_vars,
+        data_vars=list(store.data_vars),
+        chunks=store.chunks,
+        loader_function=store.loader_function,
+        data_only=True,
+    )
+    ds = xr.open_zarr(cloner, consolidated=True)
+    ds.temp.isel(time=1).values
+    assert list(target) == ["temp/1.0.0"]
+
+
+def test_compressed_chunks():
+    import json
+
+    import numcodecs
+
+    from intake_informaticslab.zarrhypothetic.zarrhypothetic import (
+        HypotheticZarrCloner,
+    )
+
+    store, _ = make_store()
+    target = {}
+    cloner = HypotheticZarrCloner(
+        target,
+        dims=store.dims,
+        coord_vars=store.coord_vars,
+        data_vars=list(store.data_vars),
+        chunks=store.chunks,
+        loader_function=store.loader_function,
+        compressor={"id": "blosc", "cname": "zstd", "shuffle": 1},
+        filters=[{"id": "bitround", "keepbits": 10}],
+    )
+    zarray = json.loads(cloner["temp/.zarray"])
+    assert zarray["compressor"]["cname"] == "zstd"
+    assert zarray["filters"] == [{"id": "bitround", "keepbits": 10}]
+    assert json.loads(cloner["time/.zarray"])["compressor"] is None
+
+    ds = xr.open_zarr(cloner, consolidated=True)
+    np.testing.assert_array_equal(ds.temp.isel(y=0, x=0).values, np.arange(5))
+    # the cloned chunk is stored encoded
+    blosc = numcodecs.get_codec(zarray["compressor"])
+    raw = np.frombuffer(blosc.decode(target["temp/0.0.0"]), dtype="float32")
+    np.testing.assert_array_equal(raw, np.zeros(12))
+
+
+def test_getitems_loads_concurrently():
+    import threading
+    import time
+
+    threads = set()
+
+    def loader(attrs):
+        threads.add(threading.get_ident())
+        time.sleep(0.05)
+        return np.full((4, 3), attrs["time"], dtype="float32")
+
+    store, _ = make_store(loader=loader, max_concurrent_loads=4)
+    ds = xr.open_zarr(store, consolidated=True, chunks={"time": 5})
+    np.testing.assert_array_equal(ds.temp.isel(y=0, x=0).values, np.arange(5))
+    assert len(threads) > 1
+
+    values = store.getitems(["temp/0.0.0", "temp/.zarray", "nothing/0"])
+    assert sorted(values) == ["temp/.zarray", "temp/0.0.0"]
+
+
+def test_prefetch_along_time():
+    import threading
+
+    loaded = []
+    release = threading.Event()
+
+    def loader(attrs):
+        if attrs["time"] > 0:
+            release.wait(5)
+        loaded.append(attrs["time"])
+        return np.full((4, 3), attrs["time"], dtype="float32")
+
+    store, _ = make_store(loader=loader, prefetch_dims=["time"], prefetch_depth=2)
+    store["temp/0.0.0"]
+    release.set()
+    value = np.frombuffer(store["temp/1.0.0"], dtype="float32")
+    np.testing.assert_array_equal(value, np.ones(12))
+    store["temp/2.0.0"]
+    info = store.prefetcher.info()
+    assert info["used"] == 2
+    # each time is only loaded once even though it was prefetched
+    assert {0, 1, 2} <= set(loaded)
+    assert len(loaded) == len(set(loaded))
+
+
+def test_chunks_in_flight_are_loaded_once():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    loaded = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def loader(attrs):
+        loaded.append(attrs["time"])
+        if attrs["time"] == 1:
+            started.set()
+            release.wait(5)
+        return np.full((4, 3), attrs["time"], dtype="float32")
+
+    class Pending(dict):
+        # tells when a second reader finds the chunk being loaded
+        def get(self, key, default=None):
+            value = super().get(key, default)
+            if value is not None:
+                waiting.set()
+            return value
+
+    waiting = threading.Event()
+    store, _ = make_store(loader=loader, prefetch_dims=["time"], prefetch_depth=1)
+    store._pending = Pending()
+    with ThreadPoolExecutor(2) as executor:
+        # e.g. two dask tasks (or getitems threads) reading the same chunk
+        first = executor.submit(store.__getitem__, "temp/1.0.0")
+        started.wait(5)
+        second = executor.submit(store.__getitem__, "temp/1.0.0")
+        waiting.wait(5)
+        # reading time 0 would prefetch time 1, which is already being loaded
+        store["temp/0.0.0"]
+        release.set()
+        assert bytes(first.result()) == bytes(second.result())
+    assert sorted(loaded) == [0, 1, 2]
+    assert store._pending == {}
+
+
+def test_metadata_and_key_enumeration():
+    import json
+
+    store, calls = make_store(chunks={"y": 3, "x": 3})
+    assert store[".zmetadata"] is store[".zmetadata"]
+    metadata = json.loads(store[".zmetadata"])["metadata"]
+    assert json.loads(store["temp/.zarray"]) == metadata["temp/.zarray"]
+    assert metadata["temp/.zarray"]["chunks"] == [1, 3, 3]
+
+    assert len(store) == len(list(store.keys()))
+    assert "temp/4.1.0" in store
+    assert "temp/5.0.0" not in store
+    assert "temp/0.0" not in store
+    assert "temp/.zgroup" not in store
+    assert "nothing/.zarray" not in store
+    assert store.listdir() == sorted(
+        [".zattrs", ".zgroup", ".zmetadata", "temp"] + ["time", "x", "y"]
+    )
+    assert store.listdir("temp")[2:] == [
+        f"{t}.{y}.0" for t in range(5) for y in range(2)
+    ]
+    assert calls == []
+
+
+def test_missing_int_chunks_read_as_missing():
+    import zarr
+
+    def loader(attrs):
+        if attrs["time"] == 2:
+            return None
+        return np.full((4, 3), attrs["time"], dtype="int16")
+
+    store, _ = make_store(loader=loader, dtypes={"temp": "int16"})
+    values = zarr.open_consolidated(store)["temp"][:]
+    assert (values[2] == -32767).all()
+    np.testing.assert_array_equal(values[1], np.ones((4, 3)))
+    ds = xr.open_zarr(store, consolidated=True)
+    assert ds.temp.isel(time=2).isnull().all()
+    assert (ds.temp.isel(time=0) == 0).all()
+
+
+def test_edge_chunks_are_padded_with_fill_value():
+    import json
+    import warnings
+
+    def loader(attrs):
+        selection = attrs["selection"]
+        shape = tuple(sl.stop - sl.start for sl in (selection["y"], selection["x"]))
+        return np.full(shape, attrs["time"], dtype="int16")
+
+    chunks = {"y": 3, "x": 3}
+    store, _ = make_store(loader=loader, chunks=chunks, dtypes={"temp": "int16"})
+    # the last chunk along y only holds one row of data (and casting NaN to
+    # int is undefined, so it must not be padded with NaN)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        edge = np.frombuffer(store["temp/2.1.0"], dtype="int16").reshape(3, 3)
+    fill_value = json.loads(store["temp/.zarray"])["fill_value"]
+    assert fill_value == -32767
+    np.testing.assert_array_equal(edge[0], [2, 2, 2])
+    assert (edge[1:] == fill_value).all()
+    ds = xr.open_zarr(store, consolidated=True)
+    np.testing.assert_array_equal(ds.temp.isel(time=2).values, np.full((4, 3), 2))
+
+    store, _ = make_store(chunks=chunks)
+    store.loader_function = lambda attrs: loader(attrs).astype("float32")
+    edge = np.frombuffer(store["temp/2.1.0"], dtype="float32").reshape(3, 3)
+    assert np.isnan(edge[1:]).all()
+
+
+def test_missing_chunks_use_fill_value():
+    import json
+
+    import pytest
+
+    from intake_informaticslab.zarrhypothetic.cache import LRUChunkCache
+    from intake_informaticslab.zarrhypothetic.zarrhypothetic import (
+        HypotheticZarrCloner,
+    )
+
+    def loader(attrs):
+        if attrs["time"] == 2:
+            return None
+        return np.full((4, 3), attrs["time"], dtype="float32")
+
+    store, _ = make_store(loader=loader, cache=LRUChunkCache(2**20))
+    assert json.loads(store["temp/.zarray"])["fill_value"] == "NaN"
+    assert json.loads(store["time/.zarray"])["fill_value"] is None
+    with pytest.raises(KeyError):
+        store["temp/2.0.0"]
+    assert "temp/2.0.0" not in store.cache
+
+    target = {}
+    cloner = HypotheticZarrCloner(
+        target,
+        dims=store.dims,
+        coord_vars=store.coord_vars,
+        data_vars=list(store.data_vars),
+        chunks=store.chunks,
+        loader_function=loader,
+        data_only=True,
+    )
+    values = xr.open_zarr(cloner, consolidated=True).temp.isel(y=0, x=0).values
+    np.testing.assert_array_equal(values, [0, 1, np.nan, 3, 4])
+    assert "temp/2.0.0" not in target
+    assert len(target) == 4
+
+
+def test_chunks_are_not_copied():
+    loaded = []
+
+    def loader(attrs):
+        loaded.append(np.full((4, 3), attrs["time"], dtype="float32"))
+        return loaded[-1]
+
+    store, _ = make_store(loader=loader)
+    value = store["temp/1.0.0"]
+    assert isinstance(value, memoryview)
+    assert np.shares_memory(np.frombuffer(value, dtype="float32"), loaded[-1])
+    np.testing.assert_array_equal(np.frombuffer(value, dtype="float32"), np.ones(12))
+
+    # converting the dtype needs a copy, as does a view of a larger array
+    store, _ = make_store(loader=lambda attrs: np.ones((4, 3), dtype="float64"))
+    np.testing.assert_array_equal(
+        np.frombuffer(store["temp/0.0.0"], dtype="float32"), np.ones(12)
+    )
+    whole = np.ones((2, 4, 3), dtype="float32")
+    store, _ = make_store(loader=lambda attrs: whole[0])
+    assert not np.shares_memory(np.frombuffer(store["temp/0.0.0"], "float32"), whole)
+
+
+def test_instrumentation_hooks():
+    import pytest
+
+    from intake_informaticslab.zarrhypothetic.cache import LRUChunkCache
+    from intake_informaticslab.zarrhypothetic.instrumentation import (
+        ChunkRecorder,
+        annotate,
+        timed,
+    )
+
+    def loader(attrs):
+        if attrs["time"] == 2:
+            return None
+        if attrs["time"] == 3:
+            raise ValueError("bad file")
+        annotate(url=f"file://{attrs['time']}.nc", nbytes=48)
+        with timed("fetch"):
+            pass
+        return np.full((4, 3), attrs["time"], dtype="float32")
+
+    recorder = ChunkRecorder(keep_events=True)
+    store, _ = make_store(loader=loader, cache=LRUChunkCache(2**20), hooks=[recorder])
+    store["temp/0.0.0"]
+    store["temp/0.0.0"]
+    with pytest.raises(KeyError):
+        store["temp/2.0.0"]
+    with pytest.raises(ValueError):
+        store["temp/3.0.0"]
+    # metadata and coords aren't chunk loads
+    store["temp/.zarray"]
+    store["time/0"]
+
+    miss, hit, missing, error = recorder.events
+    assert (miss.cache, miss.outcome, miss.url) == ("miss", "ok", "file://0.nc")
+    assert {"fetch", "copy"} <= set(miss.phases)
+    assert (hit.cache, hit.outcome, hit.url) == ("hit", "ok", None)
+    assert missing.outcome == "missing" and error.outcome == "error"
+    summary = recorder.summary()
+    assert summary["chunks"] == 4
+    assert summary["outcomes"] == {"ok": 2, "missing": 1, "error": 1}
+    assert summary["bytes"]["count"] == 1 and summary["bytes"]["total"] == 48
+    assert summary["latency"]["duration"]["count"] == 4
+
+
+def test_histogram_quantiles():
+    from intake_informaticslab.zarrhypothetic.instrumentation import Histogram
+
+    hist = Histogram([1, 2, 4, 8])
+    for value in [0.5] * 90 + [3] * 9 + [100]:
+        hist.add(value)
+    assert hist.quantile(0.5) == 1
+    assert hist.quantile(0.95) == 4
+    assert hist.quantile(1.0) == 100
+    assert hist.info()["max"] == 100
+
+
+def test_chrome_trace(tmp_path):
+    import json
+
+    from intake_informaticslab.zarrhypothetic.tracing import chrome_trace
+
+    store, _ = make_store()
+    path = tmp_path / "trace.json"
+    with chrome_trace(path, store.hooks) as tracer:
+        store.getitems([f"temp/{t}.0.0" for t in range(5)])
+    assert store.hooks == []
+    assert len(tracer.events) == 5
+
+    trace = json.loads(path.read_text())["traceEvents"]
+    chunks = [event for event in trace if event.get("cat") == "chunk"]
+    assert sorted(event["name"] for event in chunks) == [
+        f"temp/{t}.0.0" for t in range(5)
+    ]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in chunks)
+    categories = {event.get("cat") for event in trace}
+    assert {"queued", "copy"} <= categories
+    assert any(event["ph"] == "M" for event in trace)
+
+
+def test_chrome_trace_pickles():
+    import cloudpickle
+
+    from intake_informaticslab.zarrhypothetic.tracing import ChromeTrace, chrome_trace
+
+    store, _ = make_store()
+    with chrome_trace(None, store.hooks) as tracer:
+        store["temp/0.0.0"]
+        # e.g. a dataset sent to a process scheduler while being traced
+        clone = cloudpickle.loads(cloudpickle.dumps(store))
+    (copy,) = clone.hooks
+    assert isinstance(copy, ChromeTrace) and copy.events == []
+    clone["temp/0.0.0"]
+    assert len(copy.events) == 1 and len(tracer.events) == 1